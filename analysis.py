@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import my_module
+from replay import TapeReplay, read_tape
+from archive import TapeArchive
+
+
+def analyse_tape(tape, time=200, max_nodes=4000000, threads=None):
+    """
+    Evals every position of a game with the cpp search, all in one call
+    Returns dict of arrays:
+        evals: eval of the position after each ply, starting position first
+            (same scale as worm.ipynb's old evaluate_board: the weighted
+            sum of think()'s evals, with running out of moves a loss)
+        deltas: how much each successful move changed the eval
+        moves: the successful moves themselves
+    time is in millis per position; max_nodes is the total across all
+    threads (each thread's tree gets an equal share), so memory doesn't
+    grow with core count
+    """
+    if isinstance(tape, str): # i.e., a csv filename
+        tape = read_tape(tape)
+    if threads is None:
+        threads = os.cpu_count()
+    replay = TapeReplay(tape)
+    boards = np.array(
+        [replay.position(ply).export() for ply in range(len(replay))],
+        dtype=np.int16
+    )
+    threads = max(1, min(threads, len(boards))) # no point in idle ones
+    evals = my_module.analyse_game(
+        boards, time, max(1, max_nodes // threads), threads
+    )
+    return {
+        "evals": evals,
+        "deltas": np.diff(evals),
+        "moves": np.array([move for _, move in replay.moves]),
+    }
+
+
+def analyse_archive(filename, **kwargs):
+    """ analyse_tape on every game in a TapeArchive, keyed by game id """
+    archive = TapeArchive(filename)
+    return {
+        game_id: analyse_tape(archive.read(game_id)[0], **kwargs)
+        for game_id in archive
+    }
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import struct
+import numpy as np
+from board import Board, bta, atb, other_player
+from replay import read_tape
+
+
+# An archive is a pair of files:
+#   <name>: magic bytes, then one record per game, appended one after another
+#       record = header (game_id, number of flips, metadata length),
+#       then metadata as json, then one uint16 per flip
+#   <name>.idx: one INDEX_DTYPE entry per record, pointing into the above,
+#       so any game can be read without scanning the ones before it
+# Each flip packs into 16 bits:
+#   bits 0-5 from square, bits 6-11 to square (both 8 * rank + file),
+#   bits 12-13 promotion piece (index into PROMOTIONS), bit 14 success
+# Castling is stored as the king's move (e.g. E1 -> G1). The piece letter,
+# the "x" for captures and the colour are all recovered from the position,
+# so decoding replays the game on a Board
+MAGIC = b"FLIPARC1"
+RECORD_HEADER = struct.Struct("<qIH") # game_id, num flips, metadata length
+INDEX_DTYPE = np.dtype([
+    ("game_id", "<i8"), ("offset", "<i8"), ("num_flips", "<u4")
+])
+PROMOTIONS = "QRBN"
+
+
+def encode_flip(colour, success, move):
+    """ Packs one tape row into a 16-bit int """
+    if move in ["O-O", "O-O-O"]:
+        back = 0 if colour == "W" else 7
+        start, end = 8 * back + 4, 8 * back + (6 if move == "O-O" else 2)
+        promotion = 0
+    else:
+        leav_row, leav_col = bta(move[1:3])
+        targ_row, targ_col = bta(move.replace("x", "")[3:5])
+        start, end = 8 * leav_row + leav_col, 8 * targ_row + targ_col
+        promotion = PROMOTIONS.index(move[-1]) if move[-2] == "=" else 0
+    return start | (end << 6) | (promotion << 12) | ((success == "S") << 14)
+
+
+def decode_flip(board, colour, flip):
+    """ Unpacks 16-bit int into tape row, given the position it was tried in """
+    start, end = divmod(flip & 63, 8), divmod((flip >> 6) & 63, 8)
+    success = "S" if (flip >> 14) & 1 else "F"
+    piece = board.tiles[start][0]
+    if piece == "K" and abs(start[1] - end[1]) == 2:
+        return colour, success, "O-O" if end[1] == 6 else "O-O-O"
+    capture = (
+        len(board.tiles[end]) > 0
+        or (piece == "P" and start[1] != end[1]) # i.e., en passant
+    )
+    move = f"{piece}{atb(*start)}{'x' if capture else ''}{atb(*end)}"
+    if piece == "P" and end[0] in [0, 7]:
+        move += "=" + PROMOTIONS[(flip >> 12) & 3]
+    return colour, success, move
+
+
+def encode_tape(tape):
+    return np.array(
+        [encode_flip(*row) for row in tape], dtype=np.uint16
+    )
+
+
+def decode_tape(flips):
+    """ Replays the game to turn packed flips back into a tape """
+    board = Board(None, None)
+    colour = "W"
+    tape = []
+    for flip in flips:
+        row = decode_flip(board, colour, int(flip))
+        tape.append(row)
+        if row[1] == "S":
+            board.process_move(row[2], colour=colour)
+            colour = other_player[colour]
+    return tape
+
+
+class TapeArchive:
+    """
+    Append-only store of many games, readable in any order by game id
+    metadata is a dict, e.g., players, result, SUCCESS_PROB
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index_filename = filename + ".idx"
+        if not os.path.exists(filename):
+            with open(filename, "wb") as f:
+                f.write(MAGIC)
+            open(self.index_filename, "wb").close()
+        with open(filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{filename} is not a tape archive")
+        if not os.path.exists(self.index_filename):
+            self.rebuild_index()
+        self.index = np.fromfile(self.index_filename, dtype=INDEX_DTYPE)
+        self.order = None # argsort of game ids, made when first needed
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.game_ids())
+
+    def __contains__(self, game_id):
+        return bool(np.any(self.index["game_id"] == game_id))
+
+    def game_ids(self):
+        return self.index["game_id"].tolist()
+
+    def rebuild_index(self):
+        """ Recreates the .idx file by walking over every record """
+        entries = []
+        with open(self.filename, "rb") as f:
+            offset = len(MAGIC)
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                game_id, num_flips, meta_len = RECORD_HEADER.unpack(header)
+                entries.append((game_id, offset, num_flips))
+                offset += RECORD_HEADER.size + meta_len + 2 * num_flips
+                f.seek(offset)
+        np.array(entries, dtype=INDEX_DTYPE).tofile(self.index_filename)
+
+    def append(self, tape, metadata=None, game_id=None):
+        """
+        Adds one game to the end; returns its game id
+        An explicit game_id has to be new, as locate only finds one game
+        per id
+        """
+        if game_id is None:
+            game_id = int(self.index["game_id"].max()) + 1 if len(self) else 0
+        elif game_id in self:
+            raise ValueError(f"Already a game {game_id} in {self.filename}")
+        meta_bytes = json.dumps(metadata or {}).encode()
+        flips = encode_tape(tape)
+        with open(self.filename, "ab") as f:
+            offset = f.tell()
+            f.write(RECORD_HEADER.pack(game_id, len(flips), len(meta_bytes)))
+            f.write(meta_bytes)
+            f.write(flips.tobytes())
+        entry = np.array([(game_id, offset, len(flips))], dtype=INDEX_DTYPE)
+        with open(self.index_filename, "ab") as f:
+            f.write(entry.tobytes())
+        self.index = np.concatenate([self.index, entry])
+        self.order = None
+        return game_id
+
+    def locate(self, game_id):
+        """ Returns the index entry for game_id """
+        if self.order is None:
+            self.order = np.argsort(self.index["game_id"], kind="stable")
+        ids = self.index["game_id"][self.order]
+        pos = np.searchsorted(ids, game_id)
+        if pos == len(ids) or ids[pos] != game_id:
+            raise KeyError(f"No game {game_id} in {self.filename}")
+        return self.index[self.order[pos]]
+
+    def read_record(self, game_id):
+        """ Returns (metadata, packed flips) for game_id """
+        entry = self.locate(game_id)
+        with open(self.filename, "rb") as f:
+            f.seek(int(entry["offset"]))
+            _, num_flips, meta_len = RECORD_HEADER.unpack(
+                f.read(RECORD_HEADER.size)
+            )
+            metadata = json.loads(f.read(meta_len))
+            flips = np.frombuffer(f.read(2 * num_flips), dtype=np.uint16)
+        return metadata, flips
+
+    def read(self, game_id):
+        """ Returns (tape, metadata) for game_id """
+        metadata, flips = self.read_record(game_id)
+        return decode_tape(flips), metadata
+
+    def metadata(self, game_id):
+        return self.read_record(game_id)[0]
+
+
+def csv_to_archive(archive, filenames, metadata=None):
+    """ Appends csv tapes to archive; returns their new game ids """
+    return [
+        archive.append(
+            read_tape(filename),
+            {"source": os.path.basename(filename), **(metadata or {})}
+        )
+        for filename in filenames
+    ]
+
+
+def archive_to_csv(archive, game_id, filename):
+    """ Writes one game back out in the same format as save_tape_to_file """
+    tape, _ = archive.read(game_id)
+    with open(filename, "w") as f:
+        f.write("colour,success,move\n")
+        for row in tape:
+            f.write(",".join(row) + "\n")
+
+
+if __name__ == "__main__":
+    # python archive.py pack <archive> <csv> [<csv> ...]
+    # python archive.py unpack <archive> <directory>
+    if len(sys.argv) < 4 or sys.argv[1] not in ["pack", "unpack"]:
+        print("Usage: python archive.py pack <archive> <csv> [<csv> ...]")
+        print("       python archive.py unpack <archive> <directory>")
+        sys.exit(1)
+    archive = TapeArchive(sys.argv[2])
+    if sys.argv[1] == "pack":
+        ids = csv_to_archive(archive, sys.argv[3:])
+        print(f"Packed {len(ids)} games into {sys.argv[2]}")
+    else:
+        os.makedirs(sys.argv[3], exist_ok=True)
+        for game_id in archive:
+            archive_to_csv(
+                archive, game_id, os.path.join(sys.argv[3], f"{game_id}.csv")
+            )
+        print(f"Unpacked {len(archive)} games into {sys.argv[3]}")
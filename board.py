@@ -1,5 +1,7 @@
+import sys
+import hashlib
 import numpy as np
-import pandas as pd
+from position_cache import PositionCache
 
 
 # NOTE: board format goes (rank, file)
@@ -19,6 +21,27 @@ col_to_file = dict(zip(range(8), "ABCDEFGH"))
 other_player = {"B": "W", "W": "B"}
 def atb(row, col): return col_to_file[col] + str(row + 1) # array-to-board
 def bta(tile): return (int(tile[1]) - 1, file_to_col[tile[0]]) # board-to-array
+MOVE_CACHE = PositionCache(maxsize=5000) # (position, colour) -> moves
+KING_STEPS = [(i, j) for i in [-1, 0, 1] for j in [-1, 0, 1] if i or j]
+KNIGHT_STEPS = [(1, 2), (2, 1), (-1, 2), (2, -1),
+                (1, -2), (-2, 1), (-1, -2), (-2, -1)]
+ROOK_DIRS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_DIRS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+SLIDES = {"R": ROOK_DIRS, "B": BISHOP_DIRS, "Q": ROOK_DIRS + BISHOP_DIRS}
+piece_points = {"K": 30, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+# pieces/kings/material for the starting position, so Board() needn't scan
+START_PIECES = {
+    "W": {**dict(enumerate("RNBQKBNR")), **{8 + i: "P" for i in range(8)}},
+    "B": {
+        **{48 + i: "P" for i in range(8)},
+        **{56 + i: piece for i, piece in enumerate("RNBQKBNR")}
+    }
+}
+START_KINGS = {"W": (0, 4), "B": (7, 4)}
+START_MATERIAL = {
+    colour: sum(piece_points[piece] for piece in pieces.values())
+    for colour, pieces in START_PIECES.items()
+}
 
 
 
@@ -40,15 +63,86 @@ class Board():
         self.players = {"W": white, "B": black}
         self.current_player = "W" # i.e., key of whoever's move it is
         self.outcome = ""
+        self.key = None # position_key(), worked out when first needed
+        self.successor_cache = {} # colour -> successors(), made when needed
+        # Kept up to date by set_tile, so nothing needs to scan the board:
+        # colour -> {8 * row + col: piece}
+        self.pieces = {
+            colour: pieces.copy() for colour, pieces in START_PIECES.items()
+        }
+        self.kings = START_KINGS.copy() # colour -> (row, col), or None
+        self.material = START_MATERIAL.copy() # colour -> sum of piece_points
 
     def copy(self):
-        copy = Board(self.players["W"], self.players["B"])
+        # Skips __init__, as every field gets set here anyway
+        copy = Board.__new__(Board)
         copy.tiles = self.tiles.copy()
+        copy.players = self.players.copy()
+        copy.outcome = ""
         copy.epsq = self.epsq + ""
         copy.castle_list = self.castle_list.copy()
         copy.current_player = other_player[self.current_player]
+        copy.key = self.key
+        # Same position so same successors; shared, not copied, as changing
+        # a board gives it a new dict rather than clearing this one
+        copy.successor_cache = self.successor_cache
+        copy.pieces = {
+            colour: pieces.copy() for colour, pieces in self.pieces.items()
+        }
+        copy.kings = self.kings.copy()
+        copy.material = self.material.copy()
         return copy
 
+    def index_pieces(self):
+        """ Builds pieces, kings and material from scratch off the tiles """
+        self.pieces = {"W": {}, "B": {}}
+        self.kings = {"W": None, "B": None}
+        self.material = {"W": 0, "B": 0}
+        tiles = self.tiles.tolist()
+        for row in range(8):
+            for col in range(8):
+                tile = tiles[row][col]
+                if len(tile) == 2:
+                    self.pieces[tile[1]][8 * row + col] = tile[0]
+                    self.material[tile[1]] += piece_points[tile[0]]
+                    if tile[0] == "K":
+                        self.kings[tile[1]] = (row, col)
+
+    def set_tile(self, row, col, tile):
+        """ Puts tile ("" for empty) on the square, keeping pieces in step """
+        old = self.tiles[row][col]
+        if len(old) == 2:
+            del self.pieces[old[1]][8 * row + col]
+            self.material[old[1]] -= piece_points[old[0]]
+            if old[0] == "K" and self.kings[old[1]] == (row, col):
+                self.kings[old[1]] = None
+        if len(tile) == 2:
+            self.pieces[tile[1]][8 * row + col] = tile[0]
+            self.material[tile[1]] += piece_points[tile[0]]
+            if tile[0] == "K":
+                self.kings[tile[1]] = (row, col)
+        self.tiles[row][col] = tile
+
+    def position_key(self):
+        """
+        Hashable key for the position (not whose move it is, as move lists
+        and evals get asked for by colour anyway); used by the caches
+        A 16 byte digest, as the tiles' bytes alone are over 500
+        """
+        if self.key is None:
+            data = (
+                self.tiles.tobytes()
+                + "|".join(self.castle_list + [self.epsq]).encode()
+            )
+            self.key = hashlib.blake2b(data, digest_size=16).digest()
+        return self.key
+
+    def position_changed(self):
+        """ Call after changing tiles, castle_list or epsq by hand """
+        self.key = None
+        self.successor_cache = {}
+        self.index_pieces()
+
     def display_tiles(self, colour="W"):
         """ primitive print method the board to terminal output """
         lines = []
@@ -70,6 +164,38 @@ class Board():
         print(block_text)
 
     def get_all_possible_moves(self, colour):
+        """
+        Given colour, returns list of all possible moves, as strings
+        Looked up in MOVE_CACHE first, as the same position comes up a lot
+        (the list is a fresh copy, so callers can remove moves from it)
+        """
+        key = (self.position_key(), colour)
+        poss_moves = MOVE_CACHE.get(key)
+        if poss_moves is None:
+            # Interned, so all the cached lists share one copy of each move
+            poss_moves = tuple(
+                map(sys.intern, self.generate_all_possible_moves(colour))
+            )
+            MOVE_CACHE.put(key, poss_moves)
+        return list(poss_moves)
+
+    def successors(self, colour=None):
+        """
+        List of (move, child board) for every move colour can make, in
+        get_all_possible_moves order (call child.export() for the row)
+        Made once per position and kept on the board, so the game loop and
+        all the bots share it; don't change the child boards (copy first)
+        """
+        if colour is None:
+            colour = self.current_player
+        if colour not in self.successor_cache:
+            self.successor_cache[colour] = [
+                (move, self.copy().process_move(move, colour=colour))
+                for move in self.get_all_possible_moves(colour)
+            ]
+        return self.successor_cache[colour]
+
+    def generate_all_possible_moves(self, colour):
         """
         Given colour, returns list of all possible moves, as strings
         Of form:
@@ -265,15 +391,106 @@ class Board():
                         f"P{atb(start_rank, ts_file + offset)}x"
                         + self.epsq
                     )
-        # 3. Everything else
-        for row in range(8):
-            for col in range(8):
-                tile = self.tiles[row][col]
-                if len(tile) == 2:
-                    if tile[-1] == colour:
-                        poss_moves += get_tile_moves(self, row, col, colour)
+        # 3. Everything else (sorted, so moves come out in board order)
+        for square in sorted(self.pieces[colour]):
+            row, col = divmod(square, 8)
+            poss_moves += get_tile_moves(self, row, col, colour)
         return poss_moves
 
+    def get_attack_maps(self):
+        """
+        One pass over the pieces, no move strings made, returns two dicts:
+            attacks: colour -> 8x8 array, how many of that colour's pieces
+                attack each square (i.e., could take on it, including
+                squares of their own pieces, which they defend)
+            mobility: colour -> number of possible moves; always the same
+                as len(get_all_possible_moves(colour))
+        """
+        tiles = self.tiles.tolist() # plain lists are much quicker to index
+        attacks = {colour: [[0] * 8 for _ in range(8)] for colour in "WB"}
+        mobility = {"W": 0, "B": 0}
+        for colour in "WB":
+            for square, piece in self.pieces[colour].items():
+                row, col = divmod(square, 8)
+                attacked = attacks[colour]
+                if piece == "P":
+                    dir = 1 if colour == "W" else -1
+                    num_moves = 0
+                    if tiles[row + dir][col] == "":
+                        num_moves += 1
+                        start = 1 if colour == "W" else 6
+                        if (
+                            row == start
+                            and tiles[row + 2 * dir][col] == ""
+                        ):
+                            num_moves += 1
+                    for offset in [-1, 1]:
+                        if col + offset < 0 or col + offset > 7:
+                            continue
+                        attacked[row + dir][col + offset] += 1
+                        target = tiles[row + dir][col + offset]
+                        if len(target) == 2 and target[1] != colour:
+                            num_moves += 1
+                    if row + dir in [0, 7]: # i.e., promotes, 4 ways each
+                        num_moves *= 4
+                    mobility[colour] += num_moves
+                    continue
+                if piece in "KN":
+                    steps = KING_STEPS if piece == "K" else KNIGHT_STEPS
+                    for dr, dc in steps:
+                        new_row, new_col = row + dr, col + dc
+                        if (
+                            new_row < 0 or new_row > 7
+                            or new_col < 0 or new_col > 7
+                        ):
+                            continue
+                        attacked[new_row][new_col] += 1
+                        target = tiles[new_row][new_col]
+                        if len(target) < 2 or target[1] != colour:
+                            mobility[colour] += 1
+                    continue
+                for dr, dc in SLIDES[piece]:
+                    new_row, new_col = row + dr, col + dc
+                    while (
+                        new_row >= 0 and new_row <= 7
+                        and new_col >= 0 and new_col <= 7
+                    ):
+                        attacked[new_row][new_col] += 1
+                        target = tiles[new_row][new_col]
+                        if len(target) == 2:
+                            if target[1] != colour:
+                                mobility[colour] += 1
+                            break
+                        mobility[colour] += 1
+                        new_row += dr
+                        new_col += dc
+        # Castling and en passant, counted the same way as in move generation
+        for colour in "WB":
+            back = 0 if colour == "W" else 7
+            if (
+                tiles[back][1] == ""
+                and tiles[back][2] == ""
+                and tiles[back][3] == ""
+                and colour + "Q" in self.castle_list
+            ):
+                mobility[colour] += 1
+            if (
+                tiles[back][5] == ""
+                and tiles[back][6] == ""
+                and colour + "K" in self.castle_list
+            ):
+                mobility[colour] += 1
+            if self.epsq != "none":
+                ts_rank, ts_file = bta(self.epsq)
+                start_rank = 3 if ts_rank == 2 else 4
+                for offset in [-1, 1]:
+                    if ts_file + offset < 0 or ts_file + offset > 7:
+                        continue
+                    if tiles[start_rank][ts_file + offset] == "P" + colour:
+                        mobility[colour] += 1
+        attacks = {colour: np.array(attacks[colour]) for colour in "WB"}
+        return attacks, mobility
+
     def update_castle_list(self):
         """ After move, check that castling hasn't been ruled impossible """
         removals = []
@@ -321,38 +538,41 @@ class Board():
         # If castling
         if proposed_move == "O-O":
             rank = 0 if colour == "W" else 7
-            self.tiles[rank][4] = ""
-            self.tiles[rank][5] = "R" + colour
-            self.tiles[rank][6] = "K" + colour
-            self.tiles[rank][7] = ""
+            self.set_tile(rank, 4, "")
+            self.set_tile(rank, 5, "R" + colour)
+            self.set_tile(rank, 6, "K" + colour)
+            self.set_tile(rank, 7, "")
         elif proposed_move == "O-O-O":
             rank = 0 if colour == "W" else 7
-            self.tiles[rank][0] = ""
-            self.tiles[rank][1] = ""
-            self.tiles[rank][2] = "K" + colour
-            self.tiles[rank][3] = "R" + colour
-            self.tiles[rank][4] = ""
+            self.set_tile(rank, 0, "")
+            self.set_tile(rank, 1, "")
+            self.set_tile(rank, 2, "K" + colour)
+            self.set_tile(rank, 3, "R" + colour)
+            self.set_tile(rank, 4, "")
         # If not
         else:
             leav_row, leav_col = bta(proposed_move[1:3])
-            self.tiles[leav_row][leav_col] = ""
+            self.set_tile(leav_row, leav_col, "")
             targ_row, targ_col = bta(proposed_move.replace("x", "")[3:5])
             targ_tile = self.tiles[targ_row][targ_col]
             # Catch the rude and annoying case of en passant
             if "x" in proposed_move and targ_tile == "":
                 taken_row = 4 if colour == "W" else 3
-                self.tiles[taken_row][targ_col] = ""
-            self.tiles[targ_row][targ_col] = proposed_move[0] + colour
+                self.set_tile(taken_row, targ_col, "")
             # Another special case, of promotion
             if proposed_move[-2] == "=":
-                self.tiles[targ_row][targ_col] = proposed_move[-1] + colour
+                self.set_tile(targ_row, targ_col, proposed_move[-1] + colour)
+            else:
+                self.set_tile(targ_row, targ_col, proposed_move[0] + colour)
         # Final updates to internal state
+        self.key = None
+        self.successor_cache = {}
         self.update_castle_list()
         self.update_epsq(proposed_move)
         self.current_player = other_player[colour]
-        if "KW" not in self.tiles.flatten():
+        if self.kings["W"] is None:
             self.outcome = "B wins"
-        if "KB" not in self.tiles.flatten():
+        if self.kings["B"] is None:
             self.outcome = "W wins"
         return self
 
@@ -397,7 +617,7 @@ class Board():
             # Comment out following if-block to have play continue post-end
             # (useful for training NN how important a king is)
             # Note this still terminates, once it hits enough moves
-            if f"K{self.current_player}" not in self.tiles.flatten():
+            if self.kings[self.current_player] is None:
                 print(f"King taken! {self.current_player} loses!")
                 self.outcome = f"{self.current_player} wins"
                 return
@@ -1,11 +1,10 @@
 import pandas as pd
 import numpy as np
 import random
-import torch
 import time
 
 from board import Board
-from players import BozoBot, AutoDeep, OneLayer, FlatBot
+from players import create_player
 from runner import do_move, run_game
 
 
@@ -29,19 +28,70 @@ def run_head_to_head(black, white, black_name, white_name, num_iterations):
     print(f"Draws: {get_from_results(0)}")
     print("_________\n")
 
+def run_paired(bot_a, bot_b, name_a, name_b, num_pairs, first_seed=0):
+    """
+    Common random numbers: each seed is one pair of games, a as white and
+    then b as white, with the same flip luck for white (and for black) in
+    both. Luck that wins it for one colour then does so both times and
+    cancels out in the pair, so far fewer games tell the bots apart
+    Returns the pair scores, from a's point of view: +2 won both, -2 lost
+    both, 0 split (or two draws)
+    """
+    pair_scores = []
+    for i in range(num_pairs):
+        spinner = "-\\|/"[i % 4]
+        print(f"\rRunning pair {i + 1}... {spinner}", end="")
+        bot_a.colour, bot_b.colour = "W", "B"
+        first = run_game(bot_a, bot_b, seed=first_seed + i)[1]
+        bot_a.colour, bot_b.colour = "B", "W"
+        second = run_game(bot_b, bot_a, seed=first_seed + i)[1]
+        pair_scores.append(first - second)
+    scores = pd.Series(pair_scores)
+    std_err = scores.std() / np.sqrt(len(scores)) if len(scores) > 1 else 0
+    print("\n_________")
+    print(f"{name_a} vs {name_b}, {num_pairs} pairs")
+    print(f"Mean pair score: {scores.mean():+.3f} +- {std_err:.3f}")
+    for score, label in zip(
+        [2, 1, 0, -1, -2],
+        [
+            f"{name_a} won both",
+            f"{name_a} won one, drew one",
+            "Split (or both drawn)",
+            f"{name_b} won one, drew one",
+            f"{name_b} won both"
+        ]
+    ):
+        print(f"{label}: {(scores == score).sum()}")
+    print("_________\n")
+    return scores
+
 
 num_iterations = 1000
-white = FlatBot("W", "../models/big_flat_4.pt")
+paired = True # same flip luck for both bots, see run_paired
+# threads=1: one game at a time with tiny batches, so torch's thread pool
+# only adds overhead (and oversubscribes if several battles run at once)
+white = create_player(
+    "FlatBot",
+    "W",
+    model_filepath="../models/big_flat_4.pt",
+    threads=1,
+    trace=True
+)
 white_name = "BigFlat 4.0"
-black = BozoBot("B")#, "../models/big_flat_3.pt")
+black = create_player("BozoBot", "B")
 black_name = "BozoBot"
-# black = AutoDeep("B", "../models/second_pass.pt")
+# black = create_player(
+#     "AutoDeep", "B", model_filepath="../models/second_pass.pt", threads=1
+# )
 # black_name = "AutoDeep 2.0"
 
 start = time.time()
-run_head_to_head(black, white, black_name, white_name, num_iterations)
-white, black = black, white
-white_name, black_name = black_name, white_name
-white.colour, black.colour = "W", "B" # VERY important step
-run_head_to_head(black, white, black_name, white_name, num_iterations)
+if paired:
+    run_paired(white, black, white_name, black_name, num_iterations)
+else:
+    run_head_to_head(black, white, black_name, white_name, num_iterations)
+    white, black = black, white
+    white_name, black_name = black_name, white_name
+    white.colour, black.colour = "W", "B" # VERY important step
+    run_head_to_head(black, white, black_name, white_name, num_iterations)
 print(f"Time elapsed: {time.time() - start:.2f}s")
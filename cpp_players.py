@@ -0,0 +1,62 @@
+import pandas as pd
+from players import Player
+from opening_book import BOOK_FILENAME, load_book, get_move_evals
+
+
+class CppBot(Player):
+    # Uses the cpp tree search algo
+    def __init__(
+        self,
+        colour,
+        thinking_time,
+        max_tree_size,
+        bounded=False,
+        book=BOOK_FILENAME,
+        leaf_eval=None
+    ):
+        # bounded: use the whole thinking time, pruning to stay in max size
+        # book: opening book file to try before thinking (None for no book)
+        # leaf_eval: scores the search's leaves instead of material; takes
+        #   an (N, 70) int16 array of boards (export() rows), gives back N
+        #   evals in centipawns, + for white (e.g., a DeepBot's
+        #   evaluate_boards). Each round of the search is one call
+        #   With leaf_eval there's no book: the book's evals come from
+        #   material-only searches, so it would play those moves instead
+        super().__init__(colour)
+        self.poss_moves = []
+        self.preferences = None
+        self.thinking_time = thinking_time
+        self.max_tree_size = max_tree_size
+        self.bounded = bounded
+        self.leaf_eval = leaf_eval
+        self.book = (
+            load_book(book)
+            if book is not None and leaf_eval is None else None
+        )
+
+    def receive_info(self, board, poss_moves, imp_moves, new_board=True):
+        self.poss_moves = poss_moves
+        if new_board:
+            prefs = None
+            if self.book is not None:
+                prefs = self.book.lookup(board, self.colour)
+            if prefs is None:
+                prefs = get_move_evals(
+                    board,
+                    self.colour,
+                    poss_moves,
+                    self.thinking_time,
+                    self.max_tree_size,
+                    self.bounded,
+                    self.leaf_eval
+                )
+            self.preferences = pd.Series(prefs) / 100
+        self.preferences = self.preferences.loc[poss_moves].sort_values(
+            ascending=self.colour == "B"
+        )
+        print(self.preferences)
+
+    def send_move(self):
+        top_move = self.preferences.index[0]
+        self.preferences = self.preferences.iloc[1:]
+        return top_move
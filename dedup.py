@@ -0,0 +1,154 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from tape_dataset import COLUMNS as DATASET_COLUMNS
+
+
+# A deduplicated dataset has one row per distinct export() position, with
+# how many times it came up and how those games ended
+POSITION_COLUMNS = DATASET_COLUMNS[:70] # i.e., export() layout
+STAT_COLUMNS = ["count", "white_wins", "black_wins", "draws"]
+COLUMNS = POSITION_COLUMNS + STAT_COLUMNS
+# What goes in the bucket files: position plus stats, so already
+# deduplicated datasets can go back in and get merged with more
+RECORD_DTYPE = np.dtype([
+    ("position", "<i2", (70,)),
+    ("stats", "<u4", (len(STAT_COLUMNS),))
+])
+# For splitting positions into buckets; fixed so it's the same every run
+HASH_MULTIPLIERS = np.random.default_rng(0).integers(
+    1, 2 ** 62, size=70, dtype=np.int64
+) | 1
+
+
+def position_buckets(positions, num_buckets):
+    """ Bucket number for each row of an (N, 70) array of positions """
+    keys = (positions.astype(np.int64) @ HASH_MULTIPLIERS).view(np.uint64)
+    return ((keys >> np.uint64(32)) % np.uint64(num_buckets)).astype(np.int64)
+
+
+def to_records(positions, stats):
+    records = np.zeros(len(positions), dtype=RECORD_DTYPE)
+    records["position"] = positions
+    records["stats"] = stats
+    return records
+
+
+def records_from_frame(df):
+    """
+    Records from a chunk of dataset, either the runner.py/tape_dataset.py
+    layout (one row per position, with an outcome) or an already
+    deduplicated one (with the STAT_COLUMNS)
+    """
+    positions = df[POSITION_COLUMNS].to_numpy(dtype=np.int16)
+    if "count" in df.columns:
+        return to_records(positions, df[STAT_COLUMNS].to_numpy())
+    outcome = df["outcome"].to_numpy()
+    stats = np.stack([
+        np.ones(len(outcome)),
+        outcome == 1,
+        outcome == -1,
+        outcome == 0
+    ], axis=1)
+    return to_records(positions, stats)
+
+
+def read_shard(filename, chunksize=100000):
+    """ Yields the records in a dataset file, chunksize rows at a time """
+    if filename.endswith(".npz"):
+        data = np.load(filename)
+        columns = [str(column) for column in data["columns"]]
+        for key in [key for key in ["positions", "records"] if key in data]:
+            array = data[key]
+            for start in range(0, len(array), chunksize):
+                yield records_from_frame(pd.DataFrame(
+                    array[start:start + chunksize], columns=columns
+                ))
+    else:
+        for df in pd.read_csv(filename, chunksize=chunksize):
+            yield records_from_frame(df)
+
+
+def merge_records(records):
+    """ Collapses identical positions into one record, adding up stats """
+    rows = np.ascontiguousarray(records["position"])
+    keys = rows.view(np.dtype((np.void, rows.shape[1] * rows.itemsize)))
+    _, first, inverse = np.unique(
+        keys.ravel(), return_index=True, return_inverse=True
+    )
+    stats = np.zeros((len(first), len(STAT_COLUMNS)), dtype=np.uint64)
+    np.add.at(stats, inverse.ravel(), records["stats"])
+    return to_records(rows[first], stats)
+
+
+def dedup_shards(filenames, num_buckets=64, chunksize=100000, tmp_dir=None):
+    """
+    Yields deduplicated records for every position in the dataset files,
+    one bucket at a time, so memory only ever holds one bucket's worth
+    1. Every record gets written out to a bucket file by its hash, so
+        identical positions always end up in the same bucket
+    2. Each bucket is then small enough to load and merge on its own
+    """
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as bucket_dir:
+        bucket_names = [
+            os.path.join(bucket_dir, f"bucket_{i}.bin")
+            for i in range(num_buckets)
+        ]
+        for filename in filenames:
+            for records in read_shard(filename, chunksize):
+                buckets = position_buckets(records["position"], num_buckets)
+                for bucket in np.unique(buckets):
+                    with open(bucket_names[bucket], "ab") as f:
+                        records[buckets == bucket].tofile(f)
+        for bucket_name in bucket_names:
+            if os.path.exists(bucket_name):
+                yield merge_records(np.fromfile(bucket_name, RECORD_DTYPE))
+
+
+def records_to_array(records):
+    return np.concatenate(
+        [records["position"], records["stats"]], axis=1
+    ).astype(np.int64)
+
+
+def save_dedup(filenames, output, num_buckets=64, chunksize=100000):
+    """
+    Deduplicates the dataset files into output, returning (rows in, rows
+    out). csv gets written a bucket at a time; .npz has to be built up in
+    memory, but it's only the deduplicated rows
+    """
+    rows_in, rows_out, arrays = 0, 0, []
+    header = True
+    for records in dedup_shards(filenames, num_buckets, chunksize):
+        rows_in += int(records["stats"][:, 0].sum())
+        rows_out += len(records)
+        array = records_to_array(records)
+        if output.endswith(".npz"):
+            arrays.append(array)
+            continue
+        pd.DataFrame(array, columns=COLUMNS).to_csv(
+            output, mode="w" if header else "a", header=header, index=False
+        )
+        header = False
+    if output.endswith(".npz"):
+        records = (
+            np.concatenate(arrays) if len(arrays) > 0
+            else np.zeros((0, len(COLUMNS)), dtype=np.int64)
+        )
+        np.savez_compressed(output, records=records, columns=np.array(COLUMNS))
+    elif header: # i.e., nothing written, but still want the columns there
+        pd.DataFrame(columns=COLUMNS).to_csv(output, index=False)
+    return rows_in, rows_out
+
+
+if __name__ == "__main__":
+    # python dedup.py <output> <dataset> [<dataset> ...]
+    # datasets can be runner.py/tape_dataset.py output (csv or npz), or
+    # earlier dedup.py output, which gets merged in
+    if len(sys.argv) < 3:
+        print("Usage: python dedup.py <output> <dataset> [<dataset> ...]")
+        sys.exit(1)
+    rows_in, rows_out = save_dedup(sys.argv[2:], sys.argv[1])
+    print(f"{rows_in} positions -> {rows_out} distinct, in {sys.argv[1]}")
@@ -0,0 +1,125 @@
+import numpy as np
+import torch
+from players import Player
+
+
+class DeepBot(Player):
+    # Template for general neural net play
+    # They differ in how they turn boards into model input, so leave
+    # encode() empty
+
+    def __init__(
+        self,
+        colour,
+        model_filepath,
+        threads=None,
+        trace=False,
+        quantize=False,
+        eval_scale=3000
+    ):
+        # threads: torch threads for this process (None leaves torch's
+        #   default of one per core, so use 1 when running lots of workers)
+        # trace: turn the model into a frozen torchscript graph on first use
+        # quantize: int8 weights for the linear layers (a bit less accurate)
+        # eval_scale: model output (expected result, -1 to 1) to centipawns,
+        #   for evaluate_boards; 3000 is a king, i.e., a won game
+        super().__init__(colour)
+        if threads is not None:
+            torch.set_num_threads(threads)
+            try:
+                torch.set_num_interop_threads(threads)
+            except RuntimeError:
+                pass # can only be set once, before torch does any work
+        self.model = torch.load(
+            model_filepath, map_location="cpu", weights_only=False
+        )
+        self.model.eval()
+        if quantize:
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.trace = trace
+        self.eval_scale = eval_scale
+        self.traced = False
+        self.possible_moves = []
+        self.sorted_moves = []
+        self.board = None
+
+    def receive_info(self, board, possible_moves, imp_moves, new_board=True):
+        self.board = board
+        self.possible_moves = possible_moves
+        if new_board:
+            self.think()
+
+    def send_move(self):
+        top_pref = self.sorted_moves[0]
+        self.sorted_moves = self.sorted_moves[1:]
+        return top_pref
+
+    def encode(self, rows):
+        """ (N, 70) array of export() rows -> model input tensor """
+        return None
+
+    def think(self):
+        rows = {
+            move: child.export()
+            for move, child in self.board.successors(self.colour)
+        }
+        predictions = self.predict(self.encode(
+            np.array([rows[move] for move in self.possible_moves])
+        ))
+        order = -1 if self.colour == "W" else 1
+        sorted_indices = np.argsort(predictions)[::order]
+        self.sorted_moves = [self.possible_moves[i] for i in sorted_indices]
+
+    def evaluate_boards(self, rows):
+        """
+        Evals in centipawns (+ for white) for an (N, 70) array of export()
+        rows; can be a CppBot's leaf_eval, so the model scores its leaves
+        """
+        return self.predict(self.encode(np.asarray(rows))) * self.eval_scale
+
+    def predict(self, board_tensor):
+        """ Model output for each row of board_tensor, as a numpy array """
+        if self.trace and not self.traced:
+            # Batch size can differ from the example, only width matters
+            with torch.no_grad():
+                traced = torch.jit.trace(self.model, board_tensor)
+            self.model = torch.jit.optimize_for_inference(
+                torch.jit.freeze(traced)
+            )
+            self.traced = True
+        with torch.inference_mode():
+            return self.model(board_tensor)[:, 0].numpy()
+
+
+class AutoDeep(DeepBot):
+    # Uses a pre-trained neural net to do the thinking
+    # Doesn't explore any paths, just evals board which results from each move
+    def encode(self, rows):
+        temp_tens = torch.tensor(rows, dtype=torch.float32)
+        # next line is to delete en passant data...
+        return torch.cat([temp_tens[:, :68], temp_tens[:, 69:]], dim=1)
+
+
+class FlatBot(DeepBot):
+    # Also a pre-trained neural net
+    # But this is one that has a one-hot encoding of board structure
+    # So hopefully plays better
+    def encode(self, rows):
+        def get_big_tensor(array):
+            """
+            Transforms each row into a 13x8x8 tensor
+            13 correspond to empty, wpawn, ..., wking, bpawn, ..., bking
+            then the 8x8 is the board
+            all these together are returned as a (len_df)x13x8x8 tensor
+            (copypasted from model training notebook)
+            """
+            np_output = np.zeros((len(array), 13, 8, 8), dtype=np.bool_)
+            for piece_val, board_num in zip(
+                [0, 1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6], range(13)
+            ):
+                mask = (array == piece_val)
+                np_output[:, board_num, :, :] = mask.reshape(len(array), 8, 8)
+            return torch.from_numpy(np_output)
+        return get_big_tensor(rows[:, :64]).flatten(-3).float()
@@ -3,8 +3,16 @@
 #include <iostream> // For std::cout
 #include <algorithm> // For finding children with best prob; other bits too
 #include <chrono> // For timing the thinking loop
+#include <thread> // For analysing several bits of a game at once
+#include <atomic> // For handing out boards to threads in think_many
+#include <cmath> // For powers of 2 in the depth-limited search
+#include <functional> // For std::greater, and leaf evaluators
+#include <queue> // For finding the most likely leaves best-first
 #include <pybind11/pybind11.h> // For python integration
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h> // For passing boards as arrays, not lists
+#include <stdexcept> // For complaining about badly shaped arrays
+#include <cstdint> // For the small ints in Move
 
 
 #define KING 3000
@@ -17,31 +25,98 @@
 // BLOCK 1: Move generation
 using BoardState = std::array<int, 70>; // Let's make things readable
 
-std::vector<BoardState> get_king_moves(
-    BoardState bs, int si
+/* Moves come out as these small records, which get made and unmade in
+place on the one board; that way a board only gets copied when something
+actually wants to keep it (e.g., a new node in the tree) */
+struct Move {
+    int8_t from; // square the piece leaves (the king's, if castling)
+    int8_t to; // square it lands on
+    int8_t ep_sq {-1}; // en passant only: square of the pawn taken
+    int8_t rook_from {-1}; // castling only: where the rook goes from/to
+    int8_t rook_to {-1};
+    int8_t old_ep; // bs[68] before the move
+    int8_t new_ep {-1}; // and after
+    uint8_t old_castle; // bs[64] to bs[67] before the move, as bits
+    int16_t moved; // piece that moved, as it was on the board
+    int16_t placed; // what ends up on to (different for promotions)
+    int16_t captured; // what was on to before
+    int16_t ep_captured {0}; // what was on ep_sq before
+};
+
+Move new_move(const BoardState& bs, int si, int ti, int placed) {
+    // Record for a plain move (or capture) of the piece on si to ti
+    Move move;
+    move.from = si;
+    move.to = ti;
+    move.old_ep = bs[68];
+    move.old_castle = bs[64] | bs[65] << 1 | bs[66] << 2 | bs[67] << 3;
+    move.moved = bs[si];
+    move.placed = placed;
+    move.captured = bs[ti];
+    return move;
+}
+
+int material_change(const Move& move) {
+    // How much the move changes material(), e.g., +900 for white taking Q
+    return move.placed - move.moved - move.captured - move.ep_captured;
+}
+
+void make_move(BoardState& bs, const Move& move) {
+    int side {bs[69]};
+    bs[move.from] = 0;
+    if (move.ep_sq != -1) bs[move.ep_sq] = 0;
+    bs[move.to] = move.placed;
+    if (move.rook_from != -1) {
+        bs[move.rook_to] = bs[move.rook_from];
+        bs[move.rook_from] = 0;
+    }
+    bs[68] = move.new_ep;
+    if (std::abs(move.moved) == KING) {
+        bs[64 + 2 * side] = 0; // delete own castling possibilities
+        bs[65 + 2 * side] = 0;
+    }
+    // Update castle opportunities
+    if (bs[0] != ROOK) bs[65] = 0;
+    if (bs[4] != KING) {bs[64] = 0; bs[65] = 0;}
+    if (bs[7] != ROOK) bs[64] = 0;
+    if (bs[56] != -ROOK) bs[67] = 0;
+    if (bs[60] != -KING) {bs[66] = 0; bs[67] = 0;}
+    if (bs[63] != -ROOK) bs[66] = 0;
+    // Switch whose turn it is
+    bs[69] = 1 - side;
+}
+
+void unmake_move(BoardState& bs, const Move& move) {
+    // Exactly undoes make_move(bs, move)
+    bs[69] = 1 - bs[69];
+    for (int i {0}; i < 4; i++) bs[64 + i] = (move.old_castle >> i) & 1;
+    bs[68] = move.old_ep;
+    if (move.rook_from != -1) {
+        bs[move.rook_from] = bs[move.rook_to];
+        bs[move.rook_to] = 0;
+    }
+    bs[move.to] = move.captured;
+    if (move.ep_sq != -1) bs[move.ep_sq] = move.ep_captured;
+    bs[move.from] = move.moved;
+}
+
+void get_king_moves(
+    const BoardState& bs, int si, std::vector<Move>& moves
 ) {
-    std::vector<BoardState> outcomes {};
     std::array<int, 8> increments {-9, -8, -7, -1, 1, 7, 8, 9};
     for (int inc : increments) {
         int ti {si + inc}; // index of target square
         if (ti < 0 || ti > 63) continue; // i.e., move off bottom or top
         if (std::abs(ti % 8 - si % 8) == 7) continue; // i.e., wrap around
         if (bs[ti] * (1 - 2 * bs[69]) > 0) continue; // occupied by own piece
-        BoardState new_board = bs;
-        new_board[si] = 0; // clear old square
-        new_board[ti] = KING * (1 - 2 * (bs[69])); // king on new square
-        new_board[64 + 2 * bs[69]] = 0; // delete own castling possibilities
-        new_board[65 + 2 * bs[69]] = 0;
-        new_board[68] = -1; // can't do en passant after a king move
-        outcomes.push_back(new_board);
+        // (make_move takes away castling, and en passant always goes)
+        moves.push_back(new_move(bs, si, ti, KING * (1 - 2 * (bs[69]))));
     }
-    return outcomes;
 }
 
-std::vector<BoardState> get_rook_moves(
-    BoardState bs, int si, int piece
+void get_rook_moves(
+    const BoardState& bs, int si, int piece, std::vector<Move>& moves
 ) {
-    std::vector<BoardState> outcomes {};
     std::array<int, 4> dirs {-8, -1, 1, 8};
     for (int dir : dirs) {
         int ti {si};
@@ -50,22 +125,16 @@ std::vector<BoardState> get_rook_moves(
             if (ti < 0 || ti > 63) break;
             if (std::abs(ti % 8 - (ti - dir) % 8) > 1) break; // wraparound
             if (bs[ti] * (1 - 2 * bs[69]) > 0) break; // of own colour
-            BoardState new_board = bs;
-            new_board[si] = 0;
-            new_board[ti] = piece * (1 - 2 * (bs[69]));
-            new_board[68] = -1;
-            outcomes.push_back(new_board);
+            moves.push_back(new_move(bs, si, ti, piece * (1 - 2 * bs[69])));
             if (bs[ti] * (1 - 2 * bs[69]) < 0) break; // of other colour
         }
     }
-    return outcomes;
 }
 
-std::vector<BoardState> get_bishop_moves(
-    BoardState bs, int si, int piece
+void get_bishop_moves(
+    const BoardState& bs, int si, int piece, std::vector<Move>& moves
 ) {
     // Basically same structure as rook moves
-    std::vector<BoardState> outcomes {};
     std::array<int, 4> dirs {-9, -7, 7, 9};
     for (int dir : dirs) {
         int ti {si};
@@ -74,67 +143,52 @@ std::vector<BoardState> get_bishop_moves(
             if (ti < 0 || ti > 63) break;
             if (std::abs(ti % 8 - (ti - dir) % 8) > 1) break; // wraparound
             if (bs[ti] * (1 - 2 * bs[69]) > 0) break;
-            BoardState new_board = bs;
-            new_board[si] = 0;
-            new_board[ti] = piece * (1 - 2 * (bs[69]));
-            new_board[68] = -1;
-            outcomes.push_back(new_board);
+            moves.push_back(new_move(bs, si, ti, piece * (1 - 2 * bs[69])));
             if (bs[ti] * (1 - 2 * bs[69]) < 0) break;
         }
     }
-    return outcomes;
 }
 
-std::vector<BoardState> get_queen_moves(
-    BoardState bs, int si
+void get_queen_moves(
+    const BoardState& bs, int si, std::vector<Move>& moves
 ) {
-    std::vector<BoardState> outcomes = get_rook_moves(bs, si, QUEEN);
-    std::vector<BoardState> b_out = get_bishop_moves(bs, si, QUEEN);
-    outcomes.insert(outcomes.end(), b_out.begin(), b_out.end());
-    return outcomes;
+    get_rook_moves(bs, si, QUEEN, moves);
+    get_bishop_moves(bs, si, QUEEN, moves);
 }
 
-std::vector<BoardState> get_knight_moves(
-    BoardState bs, int si
+void get_knight_moves(
+    const BoardState& bs, int si, std::vector<Move>& moves
 ) {
     // Basically same structure as king moves
-    std::vector<BoardState> outcomes {};
     std::array<int, 8> increments {-17, -15, -10, -6, 6, 10, 15, 17};
     for (int inc : increments) {
         int ti {si + inc};
         if (ti < 0 || ti > 63) continue;
         if (std::abs(ti % 8 - si % 8) > 2) continue;
         if (bs[ti] * (1 - 2 * bs[69]) > 0) continue;
-        BoardState new_board = bs;
-        new_board[si] = 0;
-        new_board[ti] = KNIGHT * (1 - 2 * (bs[69]));
-        new_board[68] = -1;
-        outcomes.push_back(new_board);
+        moves.push_back(new_move(bs, si, ti, KNIGHT * (1 - 2 * (bs[69]))));
     }
-    return outcomes;
 }
 
-std::vector<BoardState> get_pawn_moves(
-    BoardState bs, int si
+void get_pawn_moves(
+    const BoardState& bs, int si, std::vector<Move>& moves
 ) {
-    std::vector<BoardState> outcomes {};
     int dir {1 - 2 * (bs[69])};
-    std::vector<int> pieces;
     // Catch promotion case
     int ti {si + dir * 8};
-    if (ti / 8 == 0 or ti / 8 == 7) pieces = {QUEEN, ROOK, BISHOP, KNIGHT};
-    else pieces = {PAWN};
+    bool promoting {ti / 8 == 0 or ti / 8 == 7};
+    auto add_moves = [&](int target) {
+        if (!promoting) {
+            moves.push_back(new_move(bs, si, target, PAWN * dir));
+            return;
+        }
+        for (int piece : {QUEEN, ROOK, BISHOP, KNIGHT}) {
+            moves.push_back(new_move(bs, si, target, piece * dir));
+        }
+    };
 
     // Single step forward
-    if (bs[ti] == 0) {
-        for (int piece : pieces) {
-            BoardState new_board = bs;
-            new_board[si] = 0;
-            new_board[ti] = piece * (1 - 2 * (bs[69]));
-            new_board[68] = -1;
-            outcomes.push_back(new_board);
-        }
-    }
+    if (bs[ti] == 0) add_moves(ti);
 
     // Attacks
     std::array<int, 2> increments {7 * dir, 9 * dir};
@@ -145,13 +199,7 @@ std::vector<BoardState> get_pawn_moves(
             && (bs[ti] * dir < 0) // of opposite colour
             && (ti >= 0 && ti <= 63) // within the board
         ) {
-            for (int piece : pieces) {
-                BoardState new_board = bs;
-                new_board[si] = 0;
-                new_board[ti] = piece * (1 - 2 * (bs[69]));
-                new_board[68] = -1;
-                outcomes.push_back(new_board);
-            }
+            add_moves(ti);
         }
     }
 
@@ -161,51 +209,48 @@ std::vector<BoardState> get_pawn_moves(
         && (bs[si + dir * 8] == 0) // next square unoccupied
         && (bs[si + dir * 16] == 0) // following square unoccupied
     ) {
-        BoardState new_board = bs;
-        new_board[si] = 0;
-        new_board[si + dir * 16] = PAWN * (1 - 2 * (bs[69]));
-        new_board[68] = si + dir * 8; // this is where en-passanter lands
-        outcomes.push_back(new_board);
+        Move move {new_move(bs, si, si + dir * 16, PAWN * dir)};
+        move.new_ep = si + dir * 8; // this is where en-passanter lands
+        moves.push_back(move);
     }
-    return outcomes;
 }
 
 
-std::vector<BoardState> get_square_moves(
-    BoardState bs, int si
+void get_square_moves(
+    const BoardState& bs, int si, std::vector<Move>& moves
 ) {
     switch ((1 - 2 * (bs[69])) * bs[si]) {
         /* bs[69] is 0 if white to move, 1 if black to move
         so this flips signs of all pieces iff black to move */
         case KING:
-            return get_king_moves(bs, si);
+            get_king_moves(bs, si, moves);
+            break;
         case QUEEN:
-            return get_queen_moves(bs, si);
+            get_queen_moves(bs, si, moves);
+            break;
         case ROOK:
-            return get_rook_moves(bs, si, ROOK);
+            get_rook_moves(bs, si, ROOK, moves);
+            break;
         case BISHOP:
-            return get_bishop_moves(bs, si, BISHOP);
+            get_bishop_moves(bs, si, BISHOP, moves);
+            break;
         case KNIGHT:
-            return get_knight_moves(bs, si);
+            get_knight_moves(bs, si, moves);
+            break;
         case PAWN:
-            return get_pawn_moves(bs, si);
+            get_pawn_moves(bs, si, moves);
+            break;
     }
-    return std::vector<BoardState> {};
 }
 
 
-std::vector<BoardState> get_poss_board_states(
-    BoardState bs
-) {
-    // Returns every possible board state that can be reached in one move
-    std::vector<BoardState> outcomes {};
+std::vector<Move> get_moves(const BoardState& bs) {
+    // Every possible move, in the same order as get_poss_board_states
+    std::vector<Move> moves {};
+    moves.reserve(64);
 
     // Iterate over tiles, get moves for each piece on the tile
-    for (int i {0}; i < 64; i++) {
-        for (BoardState ns : get_square_moves(bs, i)) {
-            outcomes.push_back(ns);
-        }
-    }
+    for (int i {0}; i < 64; i++) get_square_moves(bs, i, moves);
 
     // Castling
     int dir {1 - 2 * (bs[69])};
@@ -217,15 +262,10 @@ std::vector<BoardState> get_poss_board_states(
         && bs[base + 6] == 0
         && bs[base + 7] == ROOK * dir
     ) {
-        BoardState new_board = bs;
-        new_board[base + 4] = 0;
-        new_board[base + 5] = ROOK * dir;
-        new_board[base + 6] = KING * dir;
-        new_board[base + 7] = 0;
-        new_board[64 + 2 * bs[69]] = 0;
-        new_board[65 + 2 * bs[69]] = 0;
-        new_board[68] = -1;
-        outcomes.push_back(new_board);
+        Move move {new_move(bs, base + 4, base + 6, KING * dir)};
+        move.rook_from = base + 7;
+        move.rook_to = base + 5;
+        moves.push_back(move);
     }
     if (
         bs[66 - dir] == 1
@@ -235,16 +275,10 @@ std::vector<BoardState> get_poss_board_states(
         && bs[base + 3] == 0
         && bs[base + 4] == KING * dir
     ) {
-        BoardState new_board = bs;
-        new_board[base] = 0;
-        new_board[base + 1] = 0;
-        new_board[base + 2] = KING * dir;
-        new_board[base + 3] = ROOK * dir;
-        new_board[base + 4] = 0;
-        new_board[64 + 2 * bs[69]] = 0;
-        new_board[65 + 2 * bs[69]] = 0;
-        new_board[68] = -1;
-        outcomes.push_back(new_board);
+        Move move {new_move(bs, base + 4, base + 2, KING * dir)};
+        move.rook_from = base;
+        move.rook_to = base + 3;
+        moves.push_back(move);
     }
 
     // En passant
@@ -255,201 +289,398 @@ std::vector<BoardState> get_poss_board_states(
                 (bs[dep_idx] * dir == PAWN)
                 && (std::abs(bs[68] % 8 - dep_idx % 8) == 1)
             ) {
-                BoardState new_board = bs;
-                new_board[dep_idx] = 0;
-                new_board[bs[68]] = PAWN * dir;
-                new_board[bs[68] - 8 * dir] = 0; // delete pawn getting taken
-                new_board[68] = -1;
-                outcomes.push_back(new_board);
+                Move move {new_move(bs, dep_idx, bs[68], PAWN * dir)};
+                move.ep_sq = bs[68] - 8 * dir; // pawn getting taken
+                move.ep_captured = bs[move.ep_sq];
+                moves.push_back(move);
             }
         }
     }
+    return moves;
+}
 
-    for (BoardState& outcome : outcomes) {
-        // 1. Update castle opportunities
-        if (outcome[0] != ROOK) outcome[65] = 0;
-        if (outcome[4] != KING) {outcome[64] = 0; outcome[65] = 0;}
-        if (outcome[7] != ROOK) outcome[64] = 0;
-        if (outcome[56] != -ROOK) outcome[67] = 0;
-        if (outcome[60] != -KING) {outcome[66] = 0; outcome[67] = 0;}
-        if (outcome[63] != -ROOK) outcome[66] = 0;
-        // 2. Switch whose turn it is
-        outcome[69] = 1 - outcome[69];
+
+std::vector<BoardState> get_poss_board_states(
+    BoardState bs
+) {
+    // Returns every possible board state that can be reached in one move
+    std::vector<BoardState> outcomes {};
+    std::vector<Move> moves {get_moves(bs)};
+    outcomes.reserve(moves.size());
+    for (const Move& move : moves) {
+        make_move(bs, move);
+        outcomes.push_back(bs);
+        unmake_move(bs, move);
     }
     return outcomes;
 }
 
 
+long long perft(BoardState& bs, int depth) {
+    /* Number of move sequences depth long from bs (there's no check or
+    mate in this game, so that's every move, even after a king is gone)
+    Mostly for testing and timing the move generation */
+    if (depth == 0) return 1;
+    std::vector<Move> moves {get_moves(bs)};
+    if (depth == 1) return moves.size();
+    long long total {0};
+    for (const Move& move : moves) {
+        make_move(bs, move);
+        total += perft(bs, depth - 1);
+        unmake_move(bs, move);
+    }
+    return total;
+}
+
+
 
 // BLOCK 2: Thinkin
 
+double material(const BoardState& bs) {
+    double total {0};
+    for (int i {0}; i < 64; i++) total += bs[i];
+    return total;
+}
+
+bool attacks_square(const BoardState& bs, int sq, int dir) {
+    // Whether side dir (1 white, -1 black) has a piece hitting square sq
+    int row {sq / 8};
+    int col {sq % 8};
+    auto piece_at = [&bs](int r, int c) {
+        if (r < 0 || r > 7 || c < 0 || c > 7) return 0;
+        return bs[8 * r + c];
+    };
+    // Pawns come from the row behind (from their point of view)
+    if (piece_at(row - dir, col - 1) == PAWN * dir) return true;
+    if (piece_at(row - dir, col + 1) == PAWN * dir) return true;
+    std::array<std::array<int, 2>, 8> knight_steps {{
+        {1, 2}, {2, 1}, {2, -1}, {1, -2}, {-1, -2}, {-2, -1}, {-2, 1}, {-1, 2}
+    }};
+    for (auto [dr, dc] : knight_steps) {
+        if (piece_at(row + dr, col + dc) == KNIGHT * dir) return true;
+    }
+    for (int dr {-1}; dr <= 1; dr++) {
+        for (int dc {-1}; dc <= 1; dc++) {
+            if (dr == 0 && dc == 0) continue;
+            if (piece_at(row + dr, col + dc) == KING * dir) return true;
+            // Then slide out until hitting something
+            int slider {(dr == 0 || dc == 0) ? ROOK : BISHOP};
+            int r {row + dr};
+            int c {col + dc};
+            while (r >= 0 && r <= 7 && c >= 0 && c <= 7) {
+                int piece {bs[8 * r + c]};
+                if (piece == slider * dir || piece == QUEEN * dir) return true;
+                if (piece != 0) break;
+                r += dr;
+                c += dc;
+            }
+        }
+    }
+    return false;
+}
+
+std::vector<Move> get_ordered_moves(
+    const BoardState& bs, int& num_tactical
+) {
+    /* get_moves, but with the moves that are probably best up front:
+    captures (biggest victim first) and promotions, then moves that go
+    after the king. The rest keep their usual order after that
+    num_tactical gets set to how many of the up front ones there are */
+    std::vector<Move> moves = get_moves(bs);
+    BoardState scratch {bs}; // for trying moves on, for king attacks
+    int dir {1 - 2 * bs[69]};
+    int king_sq {-1}; // other side's king, which can only move by capture
+    for (int sq {0}; sq < 64; sq++) if (bs[sq] == -KING * dir) king_sq = sq;
+    std::vector<std::pair<double, int>> order;
+    num_tactical = 0;
+    for (int i {0}; i < moves.size(); i++) {
+        double gain = dir * material_change(moves[i]);
+        if (gain == 0 && king_sq != -1) {
+            make_move(scratch, moves[i]);
+            if (attacks_square(scratch, king_sq, dir)) gain = 1;
+            unmake_move(scratch, moves[i]);
+        }
+        if (gain > 0) num_tactical += 1;
+        order.push_back({-gain, i});
+    }
+    std::stable_sort(
+        order.begin(),
+        order.end(),
+        [](const auto& a, const auto& b) {return a.first < b.first;}
+    );
+    std::vector<Move> ordered;
+    ordered.reserve(moves.size());
+    for (auto& [key, i] : order) ordered.push_back(moves[i]);
+    return ordered;
+}
+
+
+bool has_both_kings(const BoardState& bs) {
+    bool white {false}, black {false};
+    for (int i {0}; i < 64; i++) {
+        if (bs[i] == KING) white = true;
+        if (bs[i] == -KING) black = true;
+    }
+    return white && black;
+}
+
+
+// Leaf evals from somewhere other than material (e.g., a neural net over in
+// python): given a batch of boards, gives back an eval for each one
+using LeafEvaluator = std::function<
+    std::vector<double>(const std::vector<BoardState>&)
+>;
+
+
 class ThinkingNode{
 public:
+    /* No board in here, just the move that got here from the parent (the
+    ThinkingMachine keeps the root's board, and rebuilds any other by
+    making the moves on the way down); that and small ints for everything
+    else keeps a node about a quarter the size of a board-carrying one */
     ThinkingNode* parent {};
     std::vector<ThinkingNode*> children {};
-    BoardState board {};
     double eval;
+    double static_eval; // eval as a leaf, i.e., before any search below it
     double prob;
+    // ThinkingMachine only makes children as they're needed: num_made is
+    // how far down get_ordered_moves it's got, pending how many are
+    // left, pending_prob the play prob of the best of those
+    double pending_prob {0};
+    Move move {}; // from the parent's board to this one
+    int material {0}; // i.e., material() of this node's board
+    int16_t num_made {0};
+    int16_t pending {0};
+    int8_t to_move {0}; // i.e., board[69]: 0 if white to move, 1 if black
     bool marked {true}; // Used in ThinkingMachine for uppropagate
     bool leaf {true};
+    // children thrown away by pruning, backed-up eval kept until it's
+    // likely enough to get regrown
+    bool collapsed {false};
 
     ThinkingNode() = default;
-    ThinkingNode(ThinkingNode* par, BoardState boa) {
+    ThinkingNode(ThinkingNode* par, const Move& mov) {
         this->parent = par;
-        this->board = boa; // NOTE: maybe better off not to copy-initialise?
-        this->update_eval();
+        this->move = mov;
+        this->material = par->material + material_change(mov);
+        this->to_move = 1 - par->to_move;
+        this->eval = this->material;
+        this->static_eval = this->material;
     }
 
     ~ThinkingNode() {
         for (ThinkingNode* child : children) delete child;
     }
 
-    ThinkingNode* get_highest_prob_leaf() {
-        if (children.size() == 0) return this;
-
-        ThinkingNode* best_leaf = nullptr;
-        double best_prob = -1.0;
-        for (ThinkingNode* child : children) {
-            ThinkingNode* leaf = child->get_highest_prob_leaf();
-            if (leaf->prob > best_prob) {
-                best_prob = leaf->prob;
-                best_leaf = leaf;
-            }
-        }
-        return best_leaf;
-    }
-
-    void update_eval() {
-        /* Sets own score by taking weighted mean of child scores
-        Which is 1/2 * [best one] + 1/4 * [next best] + ... */
-        if (children.size() == 0) {
-            eval = 0;
-            for (int i {0}; i < 64; i++) eval += board[i];
-            // std::cout << "\t\tleaf node eval: " << eval << "\n";
-            return;
-        }
-        std::sort(
-            children.begin(),
-            children.end(),
-            [this](const ThinkingNode* a, const ThinkingNode* b) {
-                if (this->board[69] == 0) {
-                    return a->eval > b->eval; // Descending if white
-                } else {
-                    return a->eval < b->eval; // Ascending if black
-                }
-            }
-        );
-        eval = 0;
-        double weight {1.0};
-        for (int i {0}; i < children.size(); i++){
-            weight /= 2;
-            eval += weight * children[i]->eval;
-        }
-        eval += weight * 3000 * (1 - 2 * board[69]); // If out of moves
-        // std::cout << "\tinterior node eval: " << eval << "\n";
-    }
-
-    void update_probs() {
-        /* Sets probabilities such that best move is most likely to get played
-        and so on, in preference order.
-        Note that this recurses on children */
-        std::sort(
-            children.begin(),
-            children.end(),
-            [this](const ThinkingNode* a, const ThinkingNode* b) {
-                if (this->board[69] == 0) {
-                    return a->eval > b->eval; // Descending if white
-                } else {
-                    return a->eval < b->eval; // Ascending if black
-                }
-            }
-        );
-        double weight {1.0};
-        for (int i {0}; i < children.size(); i++) {
-            weight /= 2;
-            children[i]->prob = prob * weight;
-            children[i]->update_probs();
-        }
-    }
-
-    void create_children() {
-        /* Create a child for every possible move
-        and gives them all the relevant info */
-        std::vector<BoardState> pbss = get_poss_board_states(board);
-        for (BoardState pbs : pbss) {
-            ThinkingNode* new_one = new ThinkingNode(this, pbs);
-            children.push_back(new_one);
-        }
-        ThinkingNode* curr_node = this;
-        while (curr_node != nullptr) {
-            curr_node->update_eval();
-            curr_node = curr_node->parent;
-        }
+    double frontier_prob() const {
+        // How much expanding this node is worth (if it's in the frontier)
+        return leaf ? prob : pending_prob;
     }
 };
 
 
 class ThinkingMachine {
 public:
+    /* Grows the tree a batch at a time, always at the most likely lines
+    Children get made lazily: expanding a leaf makes the captures,
+    promotions and king attacks plus one quiet move, and the rest of the
+    quiet moves wait as "pending". They're still counted in the eval (a
+    quiet move doesn't change the material, so as a leaf each one would be
+    worth exactly the node's material), they just don't get a node until
+    the best of them is likely enough to be worth expanding
+    The frontier (where it can expand: actual leaves, plus nodes with some
+    children still pending) isn't kept in a list; get_highest_prob_leaves
+    finds the best of it by going down from the root, most likely first,
+    so a round only costs about as much as what it expands
+    Nodes don't keep boards: root_board is the root's, and board_at
+    rebuilds any other from the moves on the way down to it */
     ThinkingNode root {};
-    std::vector<ThinkingNode*> leaves {};
+    BoardState root_board {};
+    int num_frontier {1}; // how many nodes are in the frontier
     int size {1}; // just out of curiosity
     int max_size {};
+    bool verbose {true};
+    bool lazy {true}; // false makes every child as soon as a leaf expands
+    // bounded: rather than stopping at max_size, collapse the least likely
+    // subtrees down to keep_frac * max_size nodes and carry on
+    bool bounded {false};
+    float keep_frac {0.5};
+    // If set, new leaves get their static evals from this instead of
+    // material, a whole expansion round's worth in one call
+    LeafEvaluator leaf_evaluator {};
+    std::vector<ThinkingNode*> new_leaves {}; // waiting on leaf_evaluator
+    std::vector<BoardState> new_leaf_boards {}; // and their boards
 
     ThinkingMachine() = default;
     ThinkingMachine(BoardState bs, int ms) {
-        this->root = ThinkingNode(nullptr, bs);
+        this->set_root_board(bs);
         this->root.prob = 1;
         this->max_size = ms;
         // this->max_size = 100000000;
-        leaves.push_back(&root);
+    }
+
+    void set_root_board(const BoardState& bs) {
+        root_board = bs;
+        root.material = material(bs);
+        root.to_move = bs[69];
+        root.eval = root.material;
+        root.static_eval = root.material;
+    }
+
+    BoardState board_at(const ThinkingNode* node) const {
+        // node's board, by making the moves from the root down to it
+        std::vector<const Move*> path;
+        for (; node != &root; node = node->parent) path.push_back(&node->move);
+        BoardState bs {root_board};
+        for (int i = path.size() - 1; i >= 0; i--) make_move(bs, *path[i]);
+        return bs;
     }
 
     std::vector<ThinkingNode*> get_highest_prob_leaves(int n) {
-        if (n == leaves.size()) return leaves;
-        // Do nth element kind-of-sort
-        std::nth_element(
-            leaves.begin(),
-            leaves.begin() + n,
-            leaves.end(),
-            [](const ThinkingNode* a, const ThinkingNode* b) {
-                return a->prob > b->prob;
+        /* The n frontier nodes with the highest frontier_prob
+        A child is always less likely than its parent, so going down from
+        the root always taking the most likely node seen so far turns up
+        frontier nodes most likely first, and never has to look at
+        anything much less likely than the nth one. Probs get worked out
+        from the children's order on the way (same as update_probs), so
+        nothing has to go over the whole tree to keep them up to date */
+        struct Entry {
+            double prob;
+            long long order; // ties go to whichever was seen first
+            ThinkingNode* node;
+            bool pending; // i.e., this is for node's pending children
+            bool operator<(const Entry& other) const {
+                if (prob != other.prob) return prob < other.prob;
+                return order > other.order;
             }
-        );
-        // Then truncate to get just the first n
-        return std::vector<ThinkingNode*>(leaves.begin(), leaves.begin() + n);
+        };
+        std::vector<ThinkingNode*> chosen;
+        std::priority_queue<Entry> heap;
+        long long order {0};
+        heap.push({1.0, order++, &root, false});
+        while (!heap.empty() && chosen.size() < n) {
+            Entry top {heap.top()};
+            heap.pop();
+            ThinkingNode* node {top.node};
+            if (top.pending) {
+                chosen.push_back(node);
+                continue;
+            }
+            node->prob = top.prob;
+            if (node->leaf) { // collapsed ones too, they get regrown
+                chosen.push_back(node);
+                continue;
+            }
+            int rank {this->pending_rank(node)};
+            double weight {1.0};
+            for (int i {0}; i <= node->children.size(); i++) {
+                if (i == rank && node->pending > 0) {
+                    node->pending_prob = node->prob * weight / 2;
+                    heap.push({node->pending_prob, order++, node, true});
+                    weight /= std::pow(2.0, node->pending);
+                }
+                if (i == node->children.size()) break;
+                weight /= 2;
+                heap.push({
+                    node->prob * weight, order++, node->children[i], false
+                });
+            }
+        }
+        return chosen;
     }
 
-    bool add_children_to_leaf(ThinkingNode* leaf) {
-        /* Adds all children to a given leaf
-        returns false if it hits maximum number of nodes; true otherwise
-        (interpret the return value as "keep going", false says stop) */
-        // Get possible moves
-        std::vector<BoardState> pbss = get_poss_board_states(leaf->board);
-        for (BoardState pbs: pbss) {
-            if (size > max_size) return false;
-            // Make a new leaf for each one
-            ThinkingNode* new_one = new ThinkingNode(leaf, pbs);
-            leaf->children.push_back(new_one);
-            leaves.push_back(new_one);
-            size += 1;
-        }
-        leaf->leaf = false;
-        // Now make sure to mark ancestors as needing eval update
-        ThinkingNode* curr_node = leaf;
+    void mark_ancestors(ThinkingNode* node) {
+        // Marks node and everything above it as needing eval update
+        ThinkingNode* curr_node = node;
         while ((curr_node != nullptr) && (!curr_node->marked)) {
             curr_node->marked = true;
             curr_node = curr_node->parent;
         }
-        return true;
+    }
+
+    void add_children_to_leaf(ThinkingNode* node, bool all) {
+        /* Makes the next batch of node's children (in
+        get_ordered_moves order): first time round the tactical ones
+        plus one quiet move, then each batch doubles the quiet moves made
+        (or with all, just makes every one that's left). Moves are
+        regenerated each time rather than kept, as the pending ones mostly
+        never get made */
+        BoardState board {board_at(node)};
+        int num_tactical {0};
+        std::vector<Move> moves {get_ordered_moves(board, num_tactical)};
+        int total = moves.size();
+        int last {total};
+        if (!all && node->num_made == 0) {
+            last = std::min(num_tactical + 1, total);
+        } else if (!all) {
+            int batch {std::max(1, node->num_made - num_tactical)};
+            last = std::min(node->num_made + batch, total);
+        }
+        num_frontier += last - node->num_made - 1; // new ones in, node out
+        if (total > last) num_frontier += 1; // ...unless it's still pending
+        for (int i {node->num_made}; i < last; i++) {
+            ThinkingNode* new_one = new ThinkingNode(node, moves[i]);
+            node->children.push_back(new_one);
+            if (leaf_evaluator) {
+                new_leaves.push_back(new_one);
+                make_move(board, moves[i]);
+                new_leaf_boards.push_back(board);
+                unmake_move(board, moves[i]);
+            }
+            size += 1;
+        }
+        node->num_made = last;
+        node->pending = total - last;
+        node->leaf = false;
+        node->collapsed = false; // eval comes from its children again
+        this->mark_ancestors(node);
+    }
+
+    void evaluate_new_leaves() {
+        /* Gets static evals for everything in new_leaves from the
+        leaf_evaluator, all in one batch. A king being gone means the game's
+        already decided, so those boards keep their material eval */
+        std::vector<ThinkingNode*> to_eval;
+        std::vector<BoardState> boards;
+        for (int i {0}; i < new_leaves.size(); i++) {
+            if (!has_both_kings(new_leaf_boards[i])) continue;
+            to_eval.push_back(new_leaves[i]);
+            boards.push_back(new_leaf_boards[i]);
+        }
+        new_leaves.clear();
+        new_leaf_boards.clear();
+        if (to_eval.empty()) return;
+        std::vector<double> evals {leaf_evaluator(boards)};
+        if (evals.size() != boards.size()) {
+            throw std::invalid_argument("leaf evaluator gave wrong # evals");
+        }
+        for (int i {0}; i < to_eval.size(); i++) {
+            to_eval[i]->static_eval = evals[i];
+            to_eval[i]->eval = evals[i];
+        }
+    }
+
+    int pending_rank(ThinkingNode* node) {
+        /* Where the pending children go in the sorted children: each is
+        worth the node's own material, so put them after anything at least
+        as good as that (for whoever is moving) */
+        if (node->pending == 0) return node->children.size();
+        int side {1 - 2 * node->to_move};
+        double base {static_cast<double>(side * node->material)};
+        int rank {0};
+        while (
+            rank < node->children.size()
+            && side * node->children[rank]->eval >= base
+        ) rank++;
+        return rank;
     }
 
     void uppropagate_evals(ThinkingNode* node) {
         // Updates evals for all the marked nodes, bottom-up
-        // Base case: it's a leaf, so just add material on the board
+        // Base case: it's a leaf, so just its static eval (material, unless
+        // there's a leaf_evaluator)
         if (node->leaf) {
-            node->eval = 0;
-            for (int i {0}; i < 64; i++) node->eval += node->board[i];
+            node->eval = node->static_eval;
             node->marked = false;
             return;
         }
@@ -465,108 +696,245 @@ public:
             node->children.begin(),
             node->children.end(),
             [node](const ThinkingNode* a, const ThinkingNode* b) {
-                if (node->board[69] == 0) {
+                if (node->to_move == 0) {
                     return a->eval > b->eval; // Descending if white
                 } else {
                     return a->eval < b->eval; // Ascending if black
                 }
             }
         );
+        int rank {this->pending_rank(node)};
+        double base {static_cast<double>(node->material)};
         node->eval = 0;
         double weight {1.0};
-        for (int i {0}; i < node->children.size(); i++){
+        for (int i {0}; i <= node->children.size(); i++){
+            if (i == rank) {
+                for (int k {0}; k < node->pending; k++) {
+                    weight /= 2;
+                    node->eval += weight * base;
+                }
+            }
+            if (i == node->children.size()) break;
             weight /= 2;
             node->eval += weight * node->children[i]->eval;
         }
-        node->eval += weight * 3000 * (1 - 2 * node->board[69]);
+        node->eval += weight * 3000 * (1 - 2 * node->to_move);
         node->marked = false;
     }
 
     void update_probs(ThinkingNode* node) {
-        /* Updates play probabilities for all nodes, top down
+        /* Updates play probabilities for all nodes, top down (only needed
+        before pruning, as get_highest_prob_leaves keeps the ones it uses
+        up to date)
         Note it's already called after children are sorted
         (implemented as a DFS because that has same effect) */
+        int rank {this->pending_rank(node)};
         double weight {1.0};
-        for (int i {0}; i < node->children.size(); i++) {
+        for (int i {0}; i <= node->children.size(); i++) {
+            if (i == rank && node->pending > 0) {
+                node->pending_prob = node->prob * weight / 2;
+                weight /= std::pow(2.0, node->pending);
+            }
+            if (i == node->children.size()) break;
             weight /= 2;
             node->children[i]->prob = node->prob * weight;
             this->update_probs(node->children[i]);
         }
     }
 
-    void clean_leaves() {
-        // Remove from leaves everything that is no longer a leaf
-        auto new_end = std::remove_if(
-            leaves.begin(),
-            leaves.end(),
-            [](const ThinkingNode* node) {return !node->leaf;}
-        );
-        leaves.erase(new_end, leaves.end());
-    }
-
     bool expand_frac_leaves(float frac) {
+        /* returns false if it hits maximum number of nodes; true otherwise
+        (interpret the return value as "keep going", false says stop) */
         // 1. Find which leaves to expand
-        int n {static_cast<int>(std::ceil(frac * leaves.size()))};
+        int n {static_cast<int>(std::ceil(frac * num_frontier))};
         if (n < 100) n = 100;
-        if (n > leaves.size()) n = leaves.size();
+        if (n > num_frontier) n = num_frontier;
         if (n > 50000) n = 50000; // Don't get too wide!
         std::vector<ThinkingNode*> expandenda = get_highest_prob_leaves(n);
-        std::cout << expandenda.size() << "\n";
+        if (expandenda.empty()) return false; // i.e., whole game searched
+        if (verbose) std::cout << expandenda.size() << "\n";
         // 2. Make them children
+        bool still_under_size {true};
         for (ThinkingNode* exp : expandenda) {
-            bool still_under_size {add_children_to_leaf(exp)};
-            if (!still_under_size) {std::cout << "hit size\n"; return false;}
+            if (size > max_size) {
+                if (verbose) std::cout << "hit size\n";
+                still_under_size = false;
+                break; // but still count what got made
+            }
+            // Root always gets every child, as they all need evals
+            this->add_children_to_leaf(exp, !lazy || exp == &root);
         }
-        // 3. Uppropagate
+        if (leaf_evaluator) this->evaluate_new_leaves();
+        // 3. Uppropagate (probs follow from the new order next round)
         this->uppropagate_evals(&root);
-        // 4. Fix probabilities
-        this->update_probs(&root);
-        // 5. Keep the list of leaves in order
-        this->clean_leaves();
-        return true;
+        // 4. If full, make some room (if allowed to)
+        if (!still_under_size && bounded) {
+            this->prune_tree(static_cast<int>(keep_frac * max_size));
+            return size <= max_size; // i.e., unless even pruning can't help
+        }
+        return still_under_size;
     }
-};
 
+    void collect_interior(
+        ThinkingNode* node, std::vector<std::pair<double, int>>& interior
+    ) {
+        // (prob, number of children) for every non-leaf below the root
+        if (node->leaf) return;
+        if (node != &root) {
+            interior.push_back({node->prob, node->children.size()});
+        }
+        for (ThinkingNode* child : node->children) {
+            this->collect_interior(child, interior);
+        }
+    }
 
-std::vector<std::pair<BoardState, double>> think_dep(BoardState bs, int time) {
-    /*
-    Note: this is deprecated think() method
-    THE function that matters
-    takes in a given board state (and how many seconds it can think)
-    returns all possible board states that can result from that
-    with their evals */
-    // Step 1: Have a bit of a think
-    ThinkingNode think_root {nullptr, bs};
-    think_root.prob = 1;
-    auto start = std::chrono::steady_clock::now();
-    auto end = start + std::chrono::seconds(time);
-    int counter {0};
-    while (std::chrono::steady_clock::now() < end) {
-        ThinkingNode* look_node = think_root.get_highest_prob_leaf();
-        look_node->create_children();
-        think_root.update_probs();
-        counter += 1;
-    }
-    std::cout << "num nodes: " << counter << "\n";
-    // Step 2: Share thoughts with the rest of us
-    std::vector<std::pair<BoardState, double>> outcomes;
-    for (ThinkingNode* child : think_root.children) {
-        outcomes.push_back({child->board, child->eval});
+    void collapse_below(ThinkingNode* node, double threshold) {
+        /* Throws away the children of every node with prob <= threshold
+        The node keeps its backed-up eval (it's not marked, so uppropagate
+        leaves it alone) and goes back in the frontier as a leaf; once it's
+        among the likeliest again it gets regrown from its move like any
+        other leaf, and its eval comes from the new children from then on */
+        if (node->leaf) return;
+        if (node != &root && node->prob <= threshold) {
+            for (ThinkingNode* child : node->children) delete child;
+            node->children.clear();
+            node->children.shrink_to_fit();
+            node->leaf = true;
+            node->collapsed = true;
+            node->num_made = 0;
+            node->pending = 0;
+            node->marked = false;
+            return;
+        }
+        for (ThinkingNode* child : node->children) {
+            this->collapse_below(child, threshold);
+        }
+    }
+
+    void prune_tree(int target) {
+        /* Gets the tree down to at most target nodes (or as near as it can
+        with the root's children kept), by collapsing the least likely
+        subtrees into their evals
+        A child always has lower prob than its parent, so keeping every
+        node above some prob keeps a proper tree hanging off the root;
+        so go through interior nodes most likely first and see how far
+        down it can go before their children don't fit any more */
+        this->update_probs(&root); // only the likely ones are up to date
+        std::vector<std::pair<double, int>> interior;
+        this->collect_interior(&root, interior);
+        std::sort(
+            interior.begin(),
+            interior.end(),
+            [](const auto& a, const auto& b) {return a.first > b.first;}
+        );
+        int kept = 1 + root.children.size();
+        double threshold {-1.0}; // i.e., keep everything
+        for (auto& [prob, num_children] : interior) {
+            if (kept + num_children > target) {
+                threshold = prob;
+                break;
+            }
+            kept += num_children;
+        }
+        this->collapse_below(&root, threshold);
+        size = 0;
+        num_frontier = 0;
+        this->count_nodes(&root);
+        if (verbose) std::cout << "pruned to " << size << "\n";
+    }
+
+    void count_nodes(ThinkingNode* node) {
+        // Works out size and num_frontier from scratch, for after a re-root
+        size += 1;
+        if (node->leaf || node->pending > 0) num_frontier += 1;
+        for (ThinkingNode* child : node->children) count_nodes(child);
+    }
+
+    void advance_root(BoardState bs) {
+        /* Moves the root down to the child with board bs, keeping the
+        search already done below it, and throws the rest of the tree away
+        If bs isn't a child (e.g., root never got expanded) starts afresh */
+        ThinkingNode* keep = nullptr;
+        for (ThinkingNode* child : root.children) {
+            if (keep == nullptr && board_at(child) == bs) keep = child;
+            else delete child;
+        }
+        root.children.clear();
+        this->set_root_board(bs); // keep's children's moves are from bs
+        root.leaf = true;
+        root.num_made = 0;
+        root.pending = 0;
+        root.collapsed = false; // root always gets searched from
+        if (keep != nullptr) {
+            root.children = keep->children;
+            root.leaf = keep->leaf;
+            root.eval = keep->eval;
+            root.num_made = keep->num_made;
+            root.pending = keep->pending;
+            keep->children.clear(); // so deleting it doesn't delete these
+            delete keep;
+            for (ThinkingNode* child : root.children) child->parent = &root;
+        }
+        root.marked = true;
+        root.prob = 1;
+        size = 0;
+        num_frontier = 0;
+        count_nodes(&root);
+        if (root.pending > 0) { // root needs all its children
+            this->add_children_to_leaf(&root, true);
+        }
+        if (leaf_evaluator) this->evaluate_new_leaves();
+        this->uppropagate_evals(&root);
+    }
+
+    double game_eval() const {
+        /* root.eval, but with the out-of-moves term the way round the
+        game has it (whoever runs out of moves loses), as worm.ipynb used
+        to work it out from think()'s output; the search keeps its own
+        sign, so the moves it picks don't change */
+        if (root.leaf) return root.eval;
+        double weight {std::pow(0.5, root.children.size() + root.pending)};
+        return root.eval - 2 * weight * 3000 * (1 - 2 * root.to_move);
     }
-    return outcomes;
-}
+
+    std::vector<std::pair<BoardState, double>> root_outcomes() const {
+        // (board, eval) for each of the root's children
+        std::vector<std::pair<BoardState, double>> outcomes;
+        for (ThinkingNode* child : root.children) {
+            BoardState bs {root_board};
+            make_move(bs, child->move);
+            outcomes.push_back({bs, child->eval});
+        }
+        return outcomes;
+    }
+};
 
 
 std::vector<std::pair<BoardState, double>> think(
-    BoardState bs, int time, int max_nodes
+    BoardState bs,
+    int time,
+    int max_nodes,
+    bool bounded,
+    LeafEvaluator leaf_evaluator = {}
 ) {
-    /* This one is not deprecated
-    Includes a few efficiencies on the above algo
-    mainly batching together operations that require iterating over
-    the entire game tree, so do far fewer traversals
-    NOTE: time is in millis now max_nodes=4m is about right */
+    /* THE function that matters
+    takes in a given board state (and how many millis it can think)
+    returns all possible board states that can result from that, with
+    their evals; operations that need a pass over the whole tree are
+    batched together, so there are far fewer traversals
+    NOTE: time is in millis now max_nodes=4m is about right
+    bounded keeps thinking for the whole time, never going past max_nodes
+    (the least likely bits of the tree get collapsed to make room)
+    leaf_evaluator (if given) scores leaves instead of material */
     float frac {0.1};
     ThinkingMachine think_machine {bs, max_nodes};
+    think_machine.bounded = bounded;
+    if (leaf_evaluator) {
+        think_machine.leaf_evaluator = leaf_evaluator;
+        // Pending children count as worth the parent's material, which
+        // means nothing next to someone else's evals, so make them all
+        think_machine.lazy = false;
+    }
     auto start = std::chrono::steady_clock::now();
     auto end = start + std::chrono::milliseconds(time);
     bool not_full {true};
@@ -574,9 +942,302 @@ std::vector<std::pair<BoardState, double>> think(
         not_full = think_machine.expand_frac_leaves(frac);
     }
     std::cout << "num nodes: " << think_machine.size << "\n";
+    return think_machine.root_outcomes();
+}
+
+
+
+std::vector<std::vector<std::pair<BoardState, double>>> think_many(
+    std::vector<BoardState> boards,
+    int time,
+    int max_nodes,
+    int threads,
+    bool bounded
+) {
+    /* think() on a whole batch of boards, several at a time, giving back
+    the same thing think() would for each one, in the same order
+    Each thread takes whichever board nobody has started on yet, so one
+    slow board doesn't hold the rest up
+    NOTE: time and max_nodes are per board, so memory is about
+    threads * max_nodes nodes; threads = 0 means one per core */
+    std::vector<std::vector<std::pair<BoardState, double>>> results(
+        boards.size()
+    );
+    if (threads < 1) threads = std::thread::hardware_concurrency();
+    if (threads < 1) threads = 1;
+    if (threads > boards.size()) threads = boards.size();
+    std::atomic<int> next_board {0};
+    auto think_worker = [&]() {
+        while (true) {
+            int i {next_board++};
+            if (i >= boards.size()) return;
+            ThinkingMachine think_machine {boards[i], max_nodes};
+            think_machine.verbose = false;
+            think_machine.bounded = bounded;
+            auto end = (
+                std::chrono::steady_clock::now()
+                + std::chrono::milliseconds(time)
+            );
+            bool not_full {true};
+            while ((std::chrono::steady_clock::now() < end) && not_full) {
+                not_full = think_machine.expand_frac_leaves(0.1);
+            }
+            results[i] = think_machine.root_outcomes();
+        }
+    };
+    std::vector<std::thread> workers;
+    for (int t {0}; t < threads; t++) workers.emplace_back(think_worker);
+    for (std::thread& worker : workers) worker.join();
+    return results;
+}
+
+
+
+std::vector<double> analyse_game(
+    std::vector<BoardState> boards, int time, int max_nodes, int threads
+) {
+    /* Evals every position of a game (game_eval: the root eval think()
+    would give, but with running out of moves a loss, as in the game).
+    Game is split into as many runs of consecutive positions as there are
+    threads; each thread then walks through its run, reusing the tree from
+    each position for the next one
+    NOTE: time is millis per position, max_nodes is per thread */
+    std::vector<double> evals(boards.size());
+    if (threads < 1) threads = 1;
+    int chunk = (boards.size() + threads - 1) / threads;
+    auto analyse_chunk = [&](int first, int last) {
+        if (first >= last) return;
+        ThinkingMachine think_machine {boards[first], max_nodes};
+        think_machine.verbose = false;
+        for (int i {first}; i < last; i++) {
+            if (i > first) think_machine.advance_root(boards[i]);
+            auto end = (
+                std::chrono::steady_clock::now()
+                + std::chrono::milliseconds(time)
+            );
+            bool not_full {true};
+            while ((std::chrono::steady_clock::now() < end) && not_full) {
+                not_full = think_machine.expand_frac_leaves(0.1);
+            }
+            evals[i] = think_machine.game_eval();
+        }
+    };
+    std::vector<std::thread> workers;
+    for (int t {0}; t < threads; t++) {
+        int first = t * chunk;
+        int last = std::min(first + chunk, static_cast<int>(boards.size()));
+        workers.emplace_back(analyse_chunk, first, last);
+    }
+    for (std::thread& worker : workers) worker.join();
+    return evals;
+}
+
+
+
+// BLOCK 3: Depth-limited search with pruning
+/* Same node values as the ThinkingMachine (1/2 * best child + 1/4 * next
+best + ...), but searched depth-first to a fixed depth, with cutoffs in the
+spirit of Star1/Star2. Node values are monotone in every child's value, so
+with some children searched and the rest only known to be within
++-EVAL_BOUND, a node's value is bounded; once those bounds say the node
+can't matter to its parent, the remaining children are skipped.
+Everything in here is from the point of view of the side to move
+(i.e., evals times +1 for white, -1 for black), so it reads like negamax */
+
+#define EVAL_BOUND 13298 // K + 9Q + 2R + 2B + 2N: no eval gets past this
+#define NO_BOUND 1e18
+
+double owa_value(std::vector<double> vals) {
+    // 1/2 * best + 1/4 * next best + ..., plus the out-of-moves term
+    std::sort(vals.begin(), vals.end(), std::greater<double>());
+    double value {0};
+    double weight {1.0};
+    for (double val : vals) {
+        weight /= 2;
+        value += weight * val;
+    }
+    return value + weight * 3000;
+}
+
+double owa_threshold(std::vector<double> others, double target) {
+    /* The y at which owa_value(others + {y}) == target; owa_value is
+    strictly increasing in y, and linear between consecutive others, so
+    go through the pieces until the solution lands in the right one */
+    std::sort(others.begin(), others.end(), std::greater<double>());
+    int n = others.size();
+    double terminal {3000.0 / std::pow(2.0, n + 1)};
+    // y in position j: others before it get 1/2, 1/4, ..., after it shift
+    double before {0}; // sum of others[i] / 2^(i+1), for i < j
+    double after {0}; // sum of others[i] / 2^(i+2), for i >= j
+    for (int i {0}; i < n; i++) after += others[i] / std::pow(2.0, i + 2);
+    for (int j {0}; j <= n; j++) {
+        double weight {1.0 / std::pow(2.0, j + 1)};
+        double y {(target - before - after - terminal) / weight};
+        double upper {j == 0 ? NO_BOUND : others[j - 1]};
+        // last piece goes all the way down, however far y ends up
+        if (j == n || y >= others[j]) return std::min(y, upper);
+        if (j < n) {
+            before += others[j] / std::pow(2.0, j + 1);
+            after -= others[j] / std::pow(2.0, j + 2);
+        }
+    }
+    return target; // can't get here, the last piece always returns
+}
+
+
+class StarSearch {
+public:
+    long long nodes {0};
+    std::chrono::steady_clock::time_point end;
+    bool out_of_time {false};
+
+    StarSearch(int time) {
+        end = (
+            std::chrono::steady_clock::now()
+            + std::chrono::milliseconds(time)
+        );
+    }
+
+    std::vector<Move> ordered_moves(const BoardState& bs) {
+        // Best-looking first (for side to move), so bounds tighten quickly
+        std::vector<Move> moves = get_moves(bs);
+        int side {1 - 2 * bs[69]};
+        std::vector<std::pair<double, int>> order;
+        for (int i {0}; i < moves.size(); i++) {
+            order.push_back({-side * material_change(moves[i]), i});
+        }
+        std::sort(order.begin(), order.end());
+        std::vector<Move> ordered;
+        ordered.reserve(moves.size());
+        for (auto& [key, i] : order) ordered.push_back(moves[i]);
+        return ordered;
+    }
+
+    std::vector<BoardState> ordered_children(BoardState bs) {
+        // Boards for ordered_moves, for the root
+        std::vector<BoardState> children;
+        for (const Move& move : ordered_moves(bs)) {
+            make_move(bs, move);
+            children.push_back(bs);
+            unmake_move(bs, move);
+        }
+        return children;
+    }
+
+    double search(BoardState& bs, int depth, double alpha, double beta) {
+        /* Returns node value if it's in (alpha, beta), otherwise a bound:
+        something <= alpha if the true value is, >= beta likewise
+        Moves get made and unmade on bs, so it's back as it was after */
+        nodes += 1;
+        if ((nodes & 1023) == 0 && std::chrono::steady_clock::now() > end) {
+            out_of_time = true;
+        }
+        if (depth == 0 || out_of_time) return (1 - 2 * bs[69]) * material(bs);
+        std::vector<Move> moves = ordered_moves(bs);
+        std::vector<double> known {};
+        for (int i {0}; i < moves.size(); i++) {
+            int unknown = moves.size() - i - 1; // after this child
+            // Bounds if every child from here on turned out worst/best
+            std::vector<double> hi_others = known;
+            std::vector<double> lo_others = known;
+            for (int k {0}; k < unknown; k++) {
+                hi_others.push_back(EVAL_BOUND);
+                lo_others.push_back(-EVAL_BOUND);
+            }
+            std::vector<double> hi_all = hi_others;
+            hi_all.push_back(EVAL_BOUND);
+            std::vector<double> lo_all = lo_others;
+            lo_all.push_back(-EVAL_BOUND);
+            double hi {owa_value(hi_all)};
+            double lo {owa_value(lo_all)};
+            if (hi <= alpha) return hi;
+            if (lo >= beta) return lo;
+            // Window for this child: outside it, this node gets cut
+            double child_alpha {
+                alpha <= -NO_BOUND
+                ? -NO_BOUND : owa_threshold(hi_others, alpha)
+            };
+            double child_beta {
+                beta >= NO_BOUND ? NO_BOUND : owa_threshold(lo_others, beta)
+            };
+            make_move(bs, moves[i]);
+            double y {-search(bs, depth - 1, -child_beta, -child_alpha)};
+            unmake_move(bs, moves[i]);
+            if (y <= child_alpha) {
+                hi_others.push_back(y);
+                return owa_value(hi_others);
+            }
+            if (y >= child_beta) {
+                lo_others.push_back(y);
+                return owa_value(lo_others);
+            }
+            known.push_back(y);
+        }
+        return owa_value(known);
+    }
+
+    std::vector<std::pair<BoardState, double>> search_root(
+        const std::vector<BoardState>& children, int depth, int top_n
+    ) {
+        /* Evals for the root's children, in the order given
+        Only the top_n best need exact values; anything that can't beat
+        them gets an upper bound instead */
+        int side {1 - 2 * children[0][69]}; // children[0][69] is opponent
+        side = -side;
+        std::vector<std::pair<BoardState, double>> outcomes;
+        std::vector<double> best {}; // best top_n exact values so far
+        for (const BoardState& child : children) {
+            double alpha {
+                best.size() < top_n ? -NO_BOUND : best[top_n - 1]
+            };
+            BoardState board {child}; // search works on it in place
+            double y {-search(board, depth - 1, -NO_BOUND, -alpha)};
+            if (y > alpha) {
+                best.push_back(y);
+                std::sort(best.begin(), best.end(), std::greater<double>());
+            }
+            outcomes.push_back({child, side * y});
+        }
+        return outcomes;
+    }
+};
+
+
+std::vector<std::pair<BoardState, double>> think_star(
+    BoardState bs, int time, int max_depth, int top_n
+) {
+    /* Iterative deepening with StarSearch, until time (millis) runs out
+    or max_depth is done. Returns the same format as think(); only the
+    top_n best children are exact, the rest are upper bounds for white
+    (lower bounds for black), which is still enough to rank them below */
+    StarSearch star_search {time};
+    std::vector<BoardState> children = star_search.ordered_children(bs);
     std::vector<std::pair<BoardState, double>> outcomes;
-    for (ThinkingNode* child : think_machine.root.children) {
-        outcomes.push_back({child->board, child->eval});
+    for (BoardState child : children) {
+        outcomes.push_back({child, material(child)});
+    }
+    if (children.size() == 0) return outcomes;
+    if (top_n < 1) top_n = 1;
+    int side {1 - 2 * bs[69]};
+    for (int depth {1}; depth <= max_depth; depth++) {
+        std::vector<std::pair<BoardState, double>> attempt {
+            star_search.search_root(children, depth, top_n)
+        };
+        if (star_search.out_of_time) break; // i.e., depth didn't finish
+        outcomes = attempt;
+        std::cout << "depth " << depth << ", num nodes: ";
+        std::cout << star_search.nodes << "\n";
+        // Search best first next time round
+        std::stable_sort(
+            outcomes.begin(),
+            outcomes.end(),
+            [side](const auto& a, const auto& b) {
+                return side * a.second > side * b.second;
+            }
+        );
+        for (int i {0}; i < outcomes.size(); i++) {
+            children[i] = outcomes[i].first;
+        }
     }
     return outcomes;
 }
@@ -587,10 +1248,185 @@ std::vector<std::pair<BoardState, double>> think(
 
 namespace py = pybind11;
 
+/* NumPy versions of the below: boards go in and out as int16 arrays (one
+row of 70 per board) and evals as float arrays, read and filled straight
+from the buffers instead of a python list of 70 ints for every board */
+using BoardArray = py::array_t<
+    int16_t, py::array::c_style | py::array::forcecast
+>;
+
+std::vector<BoardState> boards_from_array(py::array boards) {
+    // (70,) or (N, 70) array (any int dtype) into BoardStates
+    BoardArray arr = BoardArray::ensure(boards);
+    if (
+        !arr || arr.ndim() < 1 || arr.ndim() > 2
+        || arr.shape(arr.ndim() - 1) != 70
+    ) {
+        throw std::invalid_argument("boards should be (70,) or (N, 70)");
+    }
+    const int16_t* data = arr.data();
+    std::vector<BoardState> bss(arr.size() / 70);
+    for (int i {0}; i < bss.size(); i++) {
+        for (int j {0}; j < 70; j++) bss[i][j] = data[70 * i + j];
+    }
+    return bss;
+}
+
+BoardState board_from_array(py::array board) {
+    std::vector<BoardState> bss = boards_from_array(board);
+    if (bss.size() != 1) throw std::invalid_argument("expected one board");
+    return bss[0];
+}
+
+py::array_t<int16_t> array_from_boards(const std::vector<BoardState>& bss) {
+    py::array_t<int16_t> arr(
+        {static_cast<py::ssize_t>(bss.size()), py::ssize_t {70}}
+    );
+    int16_t* data = arr.mutable_data();
+    for (int i {0}; i < bss.size(); i++) {
+        for (int j {0}; j < 70; j++) data[70 * i + j] = bss[i][j];
+    }
+    return arr;
+}
+
+py::tuple arrays_from_outcomes(
+    const std::vector<std::pair<BoardState, double>>& outcomes
+) {
+    // (boards, evals) arrays, from think()'s list of (board, eval) pairs
+    std::vector<BoardState> bss;
+    py::array_t<double> evals(outcomes.size());
+    double* eval_data = evals.mutable_data();
+    for (int i {0}; i < outcomes.size(); i++) {
+        bss.push_back(outcomes[i].first);
+        eval_data[i] = outcomes[i].second;
+    }
+    return py::make_tuple(array_from_boards(bss), evals);
+}
+
+LeafEvaluator evaluator_from_python(py::object leaf_eval) {
+    /* leaf_eval is None, or a python function taking an (N, 70) int16
+    array of boards and giving back their N evals (array or list), in
+    centipawns and + for white like the material ones */
+    if (leaf_eval.is_none()) return {};
+    return [leaf_eval](const std::vector<BoardState>& bss) {
+        auto evals = leaf_eval(array_from_boards(bss)).cast<
+            py::array_t<double, py::array::c_style | py::array::forcecast>
+        >();
+        return std::vector<double>(evals.data(), evals.data() + evals.size());
+    };
+}
+
+py::array_t<int16_t> get_outcomes_array(py::array board) {
+    return array_from_boards(get_poss_board_states(board_from_array(board)));
+}
+
+py::tuple think_array(
+    py::array board, int time, int max_nodes, bool bounded,
+    py::object leaf_eval
+) {
+    return arrays_from_outcomes(think(
+        board_from_array(board), time, max_nodes, bounded,
+        evaluator_from_python(leaf_eval)
+    ));
+}
+
+std::vector<std::pair<BoardState, double>> think_list(
+    BoardState bs, int time, int max_nodes, bool bounded,
+    py::object leaf_eval
+) {
+    return think(
+        bs, time, max_nodes, bounded, evaluator_from_python(leaf_eval)
+    );
+}
+
+py::tuple think_many_array(
+    py::array boards, int time, int max_nodes, int threads, bool bounded
+) {
+    /* Returns (children, evals, offsets): children of boards[i] (and their
+    evals) are rows offsets[i] to offsets[i + 1] */
+    std::vector<BoardState> bss = boards_from_array(boards);
+    std::vector<std::vector<std::pair<BoardState, double>>> results;
+    {
+        py::gil_scoped_release release;
+        results = think_many(bss, time, max_nodes, threads, bounded);
+    }
+    std::vector<std::pair<BoardState, double>> flat;
+    py::array_t<int64_t> offsets(results.size() + 1);
+    int64_t* offset_data = offsets.mutable_data();
+    offset_data[0] = 0;
+    for (int i {0}; i < results.size(); i++) {
+        flat.insert(flat.end(), results[i].begin(), results[i].end());
+        offset_data[i + 1] = flat.size();
+    }
+    py::tuple arrays = arrays_from_outcomes(flat);
+    return py::make_tuple(arrays[0], arrays[1], offsets);
+}
+
+py::array_t<double> analyse_game_array(
+    py::array boards, int time, int max_nodes, int threads
+) {
+    std::vector<BoardState> bss = boards_from_array(boards);
+    std::vector<double> evals;
+    {
+        py::gil_scoped_release release;
+        evals = analyse_game(bss, time, max_nodes, threads);
+    }
+    py::array_t<double> arr(evals.size());
+    std::copy(evals.begin(), evals.end(), arr.mutable_data());
+    return arr;
+}
+
+long long perft_board(BoardState bs, int depth) {
+    return perft(bs, depth);
+}
+
 PYBIND11_MODULE(my_module, m) {
+    /* Array versions go first, so they get picked for numpy arrays; they
+    only take actual arrays, so lists still go to the list versions */
+    m.def("get_outcomes", &get_outcomes_array, "Gets poss board states");
+    m.def(
+        "think", &think_array, "Does the thinking",
+        py::arg("board"), py::arg("time"), py::arg("max_nodes"),
+        py::arg("bounded") = false, py::arg("leaf_eval") = py::none()
+    );
+    m.def(
+        "think_many", &think_many_array,
+        "Does the thinking for lots of boards",
+        py::arg("boards"), py::arg("time"), py::arg("max_nodes"),
+        py::arg("threads") = 0, py::arg("bounded") = false
+    );
+    m.def(
+        "analyse_game", &analyse_game_array, "Evals every position of a game",
+        py::arg("boards"), py::arg("time"), py::arg("max_nodes"),
+        py::arg("threads")
+    );
     // First one just in for bug testing, second one is the useful one
     m.def("get_outcomes", &get_poss_board_states, "Gets poss board states");
-    m.def("think", &think, "Does the thinking");
+    m.def(
+        "perft", &perft_board, "Counts move sequences depth long",
+        py::arg("board"), py::arg("depth"),
+        py::call_guard<py::gil_scoped_release>()
+    );
+    m.def(
+        "think", &think_list, "Does the thinking",
+        py::arg("board"), py::arg("time"), py::arg("max_nodes"),
+        py::arg("bounded") = false, py::arg("leaf_eval") = py::none()
+    );
+    m.def(
+        "think_star", &think_star, "Depth-limited search with pruning",
+        py::arg("board"), py::arg("time"), py::arg("max_depth") = 64,
+        py::arg("top_n") = 1
+    );
+    m.def(
+        "think_many", &think_many, "Does the thinking for lots of boards",
+        py::arg("boards"), py::arg("time"), py::arg("max_nodes"),
+        py::arg("threads") = 0, py::arg("bounded") = false,
+        py::call_guard<py::gil_scoped_release>()
+    );
+    m.def(
+        "analyse_game", &analyse_game, "Evals every position of a game",
+        py::call_guard<py::gil_scoped_release>()
+    );
 }
 
 
@@ -1,17 +1,63 @@
 import numpy as np
+from board import other_player
+from position_cache import PositionCache
+
+
+EVAL_CACHE = PositionCache(maxsize=5000) # (position, func, dict) -> eval
+PIECES = ["PW", "NW", "BW", "RW", "QW", "KW", "PB", "NB", "BB", "RB", "QB", "KB"]
+PIECE_LOOKUP = np.zeros(128, dtype=np.intp) # character code -> piece code
+for code, letter in enumerate("PNBRQK"):
+    PIECE_LOOKUP[ord(letter)] = code + 1
+MATERIAL_VALUES = np.array([0, 1, 3, 3, 5, 9, 30, -1, -3, -3, -5, -9, -30])
+SQUARES = np.arange(64)
+CENTRALITY = (
+    "0000000001111110012222100123321001233210012222100111111000000000"
+)
+RANKS = "1111111122222222333333334444444455555555666666667777777788888888"
+POSITION_WEIGHTS = {} # get_eval_dict_key(complex_eval_dict) -> weights
+
+
+def get_cached_eval(board, eval_func, eval_dict):
+    """
+    Same as eval_func(board, eval_dict), but looked up in EVAL_CACHE
+    Keyed on get_eval_dict_key rather than id(), so evals carry over
+    between thinks, and a freed dict's id can't bring back a stale eval
+    """
+    key = (board.position_key(), eval_func, get_eval_dict_key(eval_dict))
+    score = EVAL_CACHE.get(key)
+    if score is None:
+        score = eval_func(board, eval_dict)
+        EVAL_CACHE.put(key, score)
+    return score
+
+
+def get_piece_codes(tiles):
+    """
+    Turns tiles (one 8x8 board, or a stack of them) into integer codes,
+    flattened to 64 squares in export order (a1, ..., h1, a2, ..., h8)
+        0 for empty, 1-6 white PNBRQK, 7-12 black PNBRQK
+    Works on the raw characters, so there's no per-square python lookup
+    """
+    chars = np.ascontiguousarray(tiles, dtype="<U2").view(np.uint32)
+    chars = chars.reshape(chars.shape[:-2] + (64, 2))
+    return PIECE_LOOKUP[chars[..., 0]] + 6 * (chars[..., 1] == ord("B"))
+
+
+def get_stacked_piece_codes(boards):
+    """ Codes for a list of Boards, as one (len(boards), 64) array """
+    return get_piece_codes(np.stack([board.tiles for board in boards]))
 
 
 def get_board_score_material_only(board, dummy):
     """
     Simple as: sum up the pieces on the board and continue
     """
-    points_dict = {
-        "KW": 30, "QW": 9, "RW": 5, "BW": 3, "NW": 3, "PW": 1,
-        "KB": -30, "QB": -9, "RB": -5, "BB": -3, "NB": -3, "PB": -1,
-        "": 0
-    }
-    points = np.vectorize(points_dict.__getitem__)(board.tiles).sum().sum()
-    return points
+    return board.material["W"] - board.material["B"]
+
+
+def get_board_scores_material_only(codes):
+    """ Material scores for a (n, 64) array of piece codes, all in one go """
+    return MATERIAL_VALUES[codes].sum(axis=-1)
 
 
 def get_board_score_with_mobility(board, dummy):
@@ -21,9 +67,8 @@ def get_board_score_with_mobility(board, dummy):
     (i.e., won't be killing pawns to get mobility, mostly tiebreaker)
     """
     base_score = get_board_score_material_only(board, None)
-    num_white_moves = len(board.get_all_possible_moves("W"))
-    num_black_moves = len(board.get_all_possible_moves("B"))
-    return base_score + (num_white_moves - num_black_moves) / 100
+    _, mobility = board.get_attack_maps()
+    return base_score + (mobility["W"] - mobility["B"]) / 100
 
 
 def get_board_score_with_hanging(board, dummy):
@@ -31,25 +76,17 @@ def get_board_score_with_hanging(board, dummy):
     Treats hanging pieces as though they have sort of been taken already
     """
     base_score = get_board_score_material_only(board, None)
+    attacks, _ = board.get_attack_maps()
+    values = MATERIAL_VALUES[get_piece_codes(board.tiles)].reshape(8, 8)
     def get_value_hanging(colour):
-        points_dict = {
-            "KW": 30, "QW": 9, "RW": 5, "BW": 3, "NW": 3, "PW": 1,
-            "KB": -30, "QB": -9, "RB": -5, "BB": -3, "NB": -3, "PB": -1,
-            "": 0
-        }
-        squares_under_attack = {
-            move.split("x")[1][:2]
-            for move in board.get_all_possible_moves(other_player[colour])
-            if "x" in move
-        }
-        value_under_attack = sum(
-            [points_dict[board.tiles[bta(square)]]
-            for square in squares_under_attack]
-        )
+        # i.e., value of colour's pieces on squares the other side attacks
+        own_pieces = np.char.endswith(board.tiles, colour)
+        under_attack = attacks[other_player[colour]] > 0
+        value_under_attack = values[own_pieces & under_attack].sum()
         return -value_under_attack # Black hanging is good for White, etc.
     white_value_hanging = get_value_hanging("W")
     black_value_hanging = get_value_hanging("B")
-    return base_score + (white_value_hanging - black_value_hanging) / 4
+    return base_score + (white_value_hanging + black_value_hanging) / 4
 
 
 def generate_complex_eval_dict():
@@ -91,20 +128,52 @@ def generate_complex_eval_dict():
     return complex_eval_dict
 
 
+# The one everything uses unless told otherwise; made once, never changed
+COMPLEX_EVAL_DICT = generate_complex_eval_dict()
+
+
+def get_eval_dict_key(eval_dict):
+    """
+    Stable key for an eval dict, for the caches: "complex" for the shared
+    COMPLEX_EVAL_DICT, otherwise what's in it (slower to make, but equal
+    dicts share entries, and nothing hangs on to the dict itself)
+    """
+    if eval_dict is COMPLEX_EVAL_DICT:
+        return "complex"
+    if eval_dict is None:
+        return None
+    return tuple(sorted(eval_dict.items()))
+
+
+def get_position_weights(complex_eval_dict):
+    """
+    Turns a generate_complex_eval_dict() style dict into a (13, 64) array:
+    what each piece code is worth on each square
+    Made once per distinct dict, then kept in POSITION_WEIGHTS
+    """
+    key = get_eval_dict_key(complex_eval_dict)
+    if key not in POSITION_WEIGHTS:
+        weights = np.zeros((13, 64))
+        for square in range(64):
+            info = CENTRALITY[square] + RANKS[square]
+            weights[0, square] = complex_eval_dict[info]
+            for code, piece in enumerate(PIECES):
+                weights[code + 1, square] = complex_eval_dict[piece + info]
+        POSITION_WEIGHTS[key] = weights
+    return POSITION_WEIGHTS[key]
+
+
 def get_board_score_with_position(board, complex_eval_dict):
     """
     Modifies material only board score
     By weighting some squares more for some pieces,
     e.g., central ones more for knights
     """
-    def gridify(lst): return np.array(list(lst)).reshape(8, 8)
-    centrality = gridify(
-        "0000000001111110012222100123321001233210012222100111111000000000"
-    )
-    ranks = gridify(
-        "1111111122222222333333334444444455555555666666667777777788888888"
-    )
-    info_board = np.char.add(board.tiles, np.char.add(centrality, ranks))
-    evaluations = np.vectorize(complex_eval_dict.__getitem__)(info_board)
-    score = evaluations.sum().sum()
-    return score
+    weights = get_position_weights(complex_eval_dict)
+    return weights[get_piece_codes(board.tiles), SQUARES].sum()
+
+
+def get_board_scores_with_position(codes, complex_eval_dict):
+    """ Position scores for a (n, 64) array of piece codes, all in one go """
+    weights = get_position_weights(complex_eval_dict)
+    return weights[codes, SQUARES].sum(axis=-1)
@@ -1,9 +1,10 @@
 import pygame as p
 import numpy as np
-import pandas as pd
+import os
+import csv
 import time
 from board import Board
-from players import BozoBot, HumanPlayer, CppBot
+from players import HumanPlayer, create_player
 from evals import (
     generate_complex_eval_dict,
     get_board_score_with_position,
@@ -17,6 +18,10 @@ DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15
 IMAGES = {} # for the pieces
+PIECE_NAMES = [f"{piece}{colour}" for piece in "PNBRQK" for colour in "WB"]
+SPRITE_CACHE_DIR = "svgs/cache" # one png atlas of all the pieces per size
+FONTS = {} # size -> font, filled in lazily (needs p.init() first)
+TEXT_SURFACES = {} # (text, colour, size) -> rendered text
 OTHER_PLAYER = {"B": "W", "W": "B"}
 FILE_TO_COL = dict(zip("ABCDEFGH", range(8)))
 COL_TO_FILE = dict(zip(range(8), "ABCDEFGH"))
@@ -27,15 +32,46 @@ def atb(row, col): return COL_TO_FILE[col] + str(row + 1) # array-to-board
 def bta(tile): return (int(tile[1]) - 1, FILE_TO_COL[tile[0]]) # board-to-array
 
 
-def load_images():
+def build_sprite_atlas(size):
+    """ Renders every piece's svg at size x size, side by side in a row """
+    atlas = p.Surface((size * len(PIECE_NAMES), size), p.SRCALPHA)
+    for i, name in enumerate(PIECE_NAMES):
+        sprite = p.transform.scale(
+            p.image.load(f"svgs/{name}.svg"), (size, size)
+        )
+        atlas.blit(sprite, (i * size, 0))
+    return atlas
+
+
+def load_sprite_atlas(size):
+    """
+    The atlas for size from the disk cache, only rendering the svgs again
+    if there's no cached one or any svg has changed since it was made
+    """
+    filename = os.path.join(SPRITE_CACHE_DIR, f"atlas_{size}.png")
+    newest_svg = max(
+        os.path.getmtime(f"svgs/{name}.svg") for name in PIECE_NAMES
+    )
+    if os.path.exists(filename) and os.path.getmtime(filename) >= newest_svg:
+        return p.image.load(filename)
+    atlas = build_sprite_atlas(size)
+    os.makedirs(SPRITE_CACHE_DIR, exist_ok=True)
+    temp_filename = os.path.join(SPRITE_CACHE_DIR, f"atlas_{size}.tmp.png")
+    p.image.save(atlas, temp_filename)
+    os.replace(temp_filename, filename) # so nobody loads a half-written one
+    return atlas
+
+
+def load_images(size=SQ_SIZE):
     global IMAGES
+    atlas = load_sprite_atlas(size)
+    if p.display.get_surface() is not None:
+        atlas = atlas.convert_alpha() # same pixel format as screen is faster
+    # Each piece is one copy out of the atlas (a straight copy, as blitting
+    # onto a transparent surface would blend the see-through edges)
     IMAGES = {
-        f"{piece}{colour}": p.transform.scale(
-            p.image.load(f"svgs/{piece}{colour}.svg"),
-            (SQ_SIZE, SQ_SIZE)
-        )
-        for piece in "PNBRQK"
-        for colour in "WB"
+        name: atlas.subsurface((i * size, 0, size, size)).copy()
+        for i, name in enumerate(PIECE_NAMES)
     }
 
 
@@ -49,16 +85,40 @@ def get_rect(top_edge, bottom_edge, left_edge, right_edge):
     )
 
 
-def draw_text(screen, text, colour, size=28, cen=(4, 4)):
-    """ Puts some text on top of the screen; centre is in square numbers """
-    font = p.font.SysFont("menlo", size * HEIGHT // 512, True, False)
-    rendered_text = font.render(text, 0, p.Color(colour))
+def get_font(size):
+    """ Fonts are slow to make, so only make each size once """
+    if size not in FONTS:
+        FONTS[size] = p.font.SysFont("menlo", size * HEIGHT // 512, True, False)
+    return FONTS[size]
+
+
+def render_text(text, colour, size):
+    """ Rendered text surfaces, cached (moves come up over and over) """
+    key = (text, tuple(p.Color(colour)), size)
+    if key not in TEXT_SURFACES:
+        TEXT_SURFACES[key] = get_font(size).render(text, 0, p.Color(colour))
+    return TEXT_SURFACES[key]
+
+
+def blit_text(screen, text, colour, size=28, cen=(4, 4)):
+    """ Blits text centred on cen (in square numbers), returns its rect """
+    rendered_text = render_text(text, colour, size)
     text_location = p.Rect(0, 0, HEIGHT, HEIGHT).move( # move to the middle
         HEIGHT / 2 - rendered_text.get_width() / 2 + (cen[0] - 4) * SQ_SIZE,
         HEIGHT / 2 - rendered_text.get_height() / 2 + (cen[1] - 4) * SQ_SIZE,
     )
-    screen.blit(rendered_text, text_location)
-    p.display.flip()
+    return screen.blit(rendered_text, text_location)
+
+
+def draw_text(screen, text, colour, size=28, cen=(4, 4)):
+    """
+    Puts some text on top of the screen; centre is in square numbers
+    NOTE: doesn't flip the display, caller does that once it's done drawing
+    (text over the game itself is better as draw_game_state's texts, so it
+    goes out in the same display update)
+    """
+    # Only the squares under the text need repainting next frame
+    RENDERER.cover(blit_text(screen, text, colour, size=size, cen=cen))
 
 
 def get_highlights(board, square, colour, poss_moves):
@@ -83,6 +143,7 @@ def turn_clicks_to_move(player_clicks, board, poss_moves, screen):
 
     def display_promotion_options(ssq, esq, pm, pc, screen):
         margin = 0.1
+        RENDERER.invalidate() # popup goes over the board
         p.draw.rect( # Draw rectangle in middle of screen
             screen,
             p.Color("#000000"),
@@ -183,62 +244,150 @@ def turn_clicks_to_move(player_clicks, board, poss_moves, screen):
     return proposed_move
 
 
-def draw_game_state(screen, board, tape, highlights=[], colour="W", th=6):
-    """ th is tape_height """
-    def draw_squares(screen, colour):
-        # The background, i.e., the checkerboard
+class GameStateRenderer:
+    """
+    Draws the board and sidebar, remembering what is already on screen
+    so that each frame only repaints the squares and tape rows that changed
+    (and then updates just those rects, rather than flipping everything)
+    Text drawn over the top gets its rect remembered, so next frame only
+    repaints what's under it
+    """
+
+    def __init__(self):
+        self.background = None # pre-rendered checkerboard + sidebar
+        self.sidebar_base = {} # th -> sidebar surface, with buttons if room
+        self.squares = {} # (r, c) on screen -> (piece, highlighted)
+        self.tape_rows = [] # tape rows currently written in the sidebar
+        self.th = None
+        self.valid = False
+        self.covered = [] # rects drawn over since last frame
+
+    def invalidate(self):
+        """ Something else drew over the screen, so repaint all next time """
+        self.valid = False
+
+    def cover(self, rect):
+        """ Something drew over rect, so repaint what's under it next time """
+        self.covered.append(p.Rect(rect))
+
+    def uncover(self, screen, rect, th):
+        """ Puts the plain board/sidebar back under rect """
+        for base, area in [
+            (self.background, get_rect(0, 8, 0, 8)),
+            (self.sidebar_base[th], get_rect(0, 8, 8, 12))
+        ]:
+            part = rect.clip(area)
+            screen.blit(base, part, area=part)
+        return rect
+
+    def prerender(self):
+        self.background = p.Surface((WIDTH, HEIGHT))
         colours = [LIGHT, DARK]
         for row in range(DIMENSION):
             for col in range(DIMENSION):
-                colour = colours[(row + col) % 2] # 0 for light, 1 for dark
-                c = col if colour == "W" else 7 - col
-                r = row if colour == "W" else 7 - row
-                p.draw.rect(screen, colour, get_rect(r, r + 1, c, c + 1))
-    def draw_highlights(screen, highlights, colour):
-        for highlight in highlights:
-            board_form = bta(highlight)
-            row, col = 7 - board_form[0], board_form[1]
-            c = col if colour == "W" else 7 - col
-            r = row if colour == "W" else 7 - row
-            p.draw.rect(
-                screen, p.Color("#BCBAFF"),
-                get_rect(r, r + 1, c, c + 1)
-            )
-    def draw_pieces(screen, board, colour):
-        for row in range(DIMENSION):
-            for col in range(DIMENSION):
-                current_piece = board.tiles[7 - row][col]
-                c = col if colour == "W" else 7 - col
-                r = row if colour == "W" else 7 - row
-                if len(current_piece) > 0:
-                    screen.blit(
-                        IMAGES[current_piece],
-                        get_rect(r, r + 1, c, c + 1)
-                    )
-    def draw_sidebar(screen, tape):
-        def write_tape_row(index, row):
-            ac = 9 if row["colour"] == "W" else 11
+                p.draw.rect( # 0 for light, 1 for dark
+                    self.background, colours[(row + col) % 2],
+                    get_rect(row, row + 1, col, col + 1)
+                )
+        for th in [6, 8]:
+            sidebar = p.Surface((WIDTH, HEIGHT))
+            p.draw.rect(sidebar, p.Color("#6E3E02"), get_rect(0, 8, 8, 12))
+            if th <= 6: # i.e., there is space for buttons
+                p.draw.rect(sidebar, LIGHT, get_rect(6.1, 6.9, 8.1, 11.9))
+                p.draw.rect(sidebar, DARK, get_rect(6.2, 6.8, 8.2, 11.8))
+                p.draw.rect(sidebar, LIGHT, get_rect(7.1, 7.9, 8.1, 11.9))
+                p.draw.rect(sidebar, DARK, get_rect(7.2, 7.8, 8.2, 11.8))
+                blit_text(sidebar, "Save and quit", LIGHT, 16, (10, 6.5))
+                blit_text(sidebar, "Quit without saving", LIGHT, 16, (10, 7.5))
+            self.sidebar_base[th] = sidebar
+
+    def draw_square(self, screen, r, c, piece, highlighted):
+        rect = get_rect(r, r + 1, c, c + 1)
+        screen.blit(self.background, rect, area=rect)
+        if highlighted:
+            p.draw.rect(screen, p.Color("#BCBAFF"), rect)
+        if len(piece) > 0:
+            screen.blit(IMAGES[piece], rect)
+        return rect
+
+    def draw_tape_row(self, screen, index, row, th):
+        """ Repaints sidebar strip number index; row is None to clear it """
+        rect = get_rect(ROW_HEIGHT * index, ROW_HEIGHT * (index + 1), 8, 12)
+        screen.blit(self.sidebar_base[th], rect, area=rect)
+        if row is not None:
+            ac = 9 if row[0] == "W" else 11
             dn = ROW_HEIGHT * (index + 1 / 2)
-            colour = "Green" if row["success"] == "S" else "Red"
-            draw_text(screen, row["move"], colour, size=18, cen=(ac, dn))
-        p.draw.rect(screen, p.Color("#6E3E02"), get_rect(0, 8, 8, 12))
-        tape_df = pd.DataFrame(tape, columns=["colour", "success", "move"])
-        printable = tape_df.tail(int(th / ROW_HEIGHT))
-        for index, row in printable.reset_index().iterrows():
-            write_tape_row(index, row)
-        if th > 6: # i.e., no space for buttons
-            return
-        p.draw.rect(screen, LIGHT, get_rect(6.1, 6.9, 8.1, 11.9))
-        p.draw.rect(screen, DARK, get_rect(6.2, 6.8, 8.2, 11.8))
-        p.draw.rect(screen, LIGHT, get_rect(7.1, 7.9, 8.1, 11.9))
-        p.draw.rect(screen, DARK, get_rect(7.2, 7.8, 8.2, 11.8))
-        draw_text(screen, "Save and quit", LIGHT, size=16, cen=(10, 6.5))
-        draw_text(screen, "Quit without saving", LIGHT, size=16, cen=(10, 7.5))
-    draw_squares(screen, colour)
-    draw_highlights(screen, highlights, colour)
-    draw_pieces(screen, board, colour)
-    draw_sidebar(screen, tape)
-    p.display.flip()
+            colour = "Green" if row[1] == "S" else "Red"
+            blit_text(screen, row[2], colour, size=18, cen=(ac, dn))
+        return rect
+
+    def draw(self, screen, board, tape, highlights, colour, th, texts=()):
+        if self.background is None:
+            self.prerender()
+        full = not self.valid or th != self.th
+        covered, self.covered = self.covered, []
+        dirty = []
+        if full:
+            screen.blit(self.background, (0, 0))
+            screen.blit(self.sidebar_base[th], (8 * SQ_SIZE, 0),
+                        area=get_rect(0, 8, 8, 12))
+            self.squares = {}
+            self.tape_rows = []
+            covered = []
+        else: # 0. Clear away last frame's text
+            dirty += [self.uncover(screen, rect, th) for rect in covered]
+        # 1. Board squares (highlights and pieces)
+        highlights = set(highlights)
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                row = r if colour == "W" else 7 - r
+                col = c if colour == "W" else 7 - c
+                piece = board.tiles[7 - row][col]
+                key = (piece, atb(7 - row, col) in highlights)
+                under_text = (
+                    get_rect(r, r + 1, c, c + 1).collidelist(covered) != -1
+                )
+                if full or under_text or self.squares.get((r, c)) != key:
+                    dirty.append(self.draw_square(screen, r, c, *key))
+                    self.squares[(r, c)] = key
+        # 2. Sidebar, only touching the rows of the tape that changed
+        tape_rows = [tuple(row) for row in get_visible_tape(tape, th)]
+        for index in range(max(len(tape_rows), len(self.tape_rows))):
+            new = tape_rows[index] if index < len(tape_rows) else None
+            old = self.tape_rows[index] if index < len(self.tape_rows) else None
+            under_text = get_rect(
+                ROW_HEIGHT * index, ROW_HEIGHT * (index + 1), 8, 12
+            ).collidelist(covered) != -1
+            if full or under_text or new != old:
+                dirty.append(self.draw_tape_row(screen, index, new, th))
+        self.tape_rows = tape_rows
+        self.th = th
+        self.valid = True
+        # 3. Text on top, e.g., (text, colour) or (text, colour, size, cen)
+        for text in texts:
+            rect = blit_text(screen, *text)
+            self.cover(rect)
+            dirty.append(rect)
+        # 4. One display update per frame
+        if full:
+            p.display.flip()
+        elif len(dirty) > 0:
+            p.display.update(dirty)
+
+
+RENDERER = GameStateRenderer()
+
+
+def get_visible_tape(tape, th=6):
+    """ The last few tape rows, i.e., the ones that fit in the sidebar """
+    return tape[-int(th / ROW_HEIGHT):]
+
+
+def draw_game_state(
+    screen, board, tape, highlights=[], colour="W", th=6, texts=()
+):
+    """ th is tape_height; texts get drawn on top, see RENDERER.draw """
+    RENDERER.draw(screen, board, tape, highlights, colour, th, texts)
 
 
 def choose_players(screen):
@@ -263,8 +412,13 @@ def choose_players(screen):
                         if abs(location[1] - 4 * SQ_SIZE) < SQ_SIZE / 2:
                             return HumanPlayer(colour[0])
                         elif abs(location[1] - 5.5 * SQ_SIZE) < SQ_SIZE / 2:
-                            # return BozoBot(colour[0])
-                            return CppBot(colour[0], 1000, 4000000)
+                            # return create_player("BozoBot", colour[0])
+                            return create_player(
+                                "CppBot",
+                                colour[0],
+                                thinking_time=1000,
+                                max_tree_size=4000000
+                            )
     def select_time(screen):
         tt = 10
         while True:
@@ -303,6 +457,7 @@ def choose_players(screen):
 def handle_ending(screen, board):
     def draw_ending_screen(screen, board):
         draw_game_state(screen, board, TAPE)
+        RENDERER.invalidate()
         for marg, colour in zip([0.1, 0], [DARK, LIGHT]):
             p.draw.rect(
                 screen, colour,
@@ -339,8 +494,10 @@ def handle_ending(screen, board):
 
 def save_tape_to_file():
     filename = f"tapes/{time.strftime('%Y-%m-%d %H-%M-%S')}.csv"
-    tape_df = pd.DataFrame(TAPE, columns=["colour", "success", "move"])
-    tape_df.to_csv(filename, index=False)
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["colour", "success", "move"])
+        writer.writerows(TAPE)
 
 
 def load_position(board, data_list):
@@ -360,6 +517,7 @@ def load_position(board, data_list):
     else:
         board.epsq = "ABCDEFGH"[data_list[68] % 8] + str(data_list[68] // 8)
     board.current_player = "W" if data_list[69] == 0 else "B"
+    board.position_changed()
 
 
 def main():
@@ -398,10 +556,12 @@ def main():
                             if col > 7 and row == 1:
                                 save_tape_to_file()
                                 draw_text(screen, "Saved!", "Green", size=36)
+                                p.display.flip()
                                 time.sleep(0.25)
                                 return
                             elif col > 7 and row == 0:
                                 draw_text(screen, "Quitting", "Green", size=36)
+                                p.display.flip()
                                 time.sleep(0.25)
                                 return
                             if current_player.colour == "B":
@@ -445,10 +605,9 @@ def main():
             if move_succeeds:
                 print(f"Flip succeeds! {proposed_move} accepted")
                 TAPE.append((board.current_player, "S", proposed_move))
-                draw_game_state(screen, board, TAPE)
-                draw_text(
-                    screen, f"Flip succeeds! {proposed_move} accepted", "Green"
-                )
+                draw_game_state(screen, board, TAPE, texts=[
+                    (f"Flip succeeds! {proposed_move} accepted", "Green")
+                ])
                 time.sleep(1)
                 break
             else:
@@ -457,10 +616,9 @@ def main():
                 poss_moves.remove(proposed_move)
                 imp_moves.append(proposed_move)
                 draw_game_state(
-                    screen, board, TAPE, colour=board.current_player
-                )
-                draw_text(
-                    screen, f"Flip fails! {proposed_move} rejected", "Red"
+                    screen, board, TAPE, colour=board.current_player, texts=[
+                        (f"Flip fails! {proposed_move} rejected", "Red")
+                    ]
                 )
                 time.sleep(1)
                 if len(poss_moves) == 0:
@@ -472,7 +630,7 @@ def main():
                 continue
         # 4. Process the move
         board.process_move(proposed_move)
-        if f"K{board.current_player}" not in board.tiles.flatten():
+        if board.kings[board.current_player] is None:
             print(f"King taken! {board.current_player} loses!")
             board.outcome = OTHER_PLAYER[board.current_player] + " wins"
             running = False
@@ -0,0 +1,247 @@
+import os
+import sys
+import heapq
+import struct
+import hashlib
+import numpy as np
+from board import Board, other_player
+from archive import encode_flip, decode_flip
+
+
+# A book is one file, read through a memory map so opening it is free:
+#   header: magic bytes, number of hash slots, number of entries
+#   slots: open addressing hash table of SLOT_DTYPE, keyed on position_hash
+#       (key 0 means an empty slot), each pointing at a run of entries
+#   entries: one ENTRY_DTYPE per move in that position, i.e., the move
+#       packed as in archive.py and the eval think() gave its result
+MAGIC = b"FLIPBOOK"
+HEADER = struct.Struct("<8sQQ") # magic, num slots, num entries
+SLOT_DTYPE = np.dtype([("key", "<u8"), ("first", "<u4"), ("count", "<u2")])
+ENTRY_DTYPE = np.dtype([("move", "<u2"), ("eval", "<f4")])
+BOOK_FILENAME = "opening_book.bin"
+BOOKS = {} # filename -> OpeningBook, so each file only gets mapped once
+
+
+def position_hash(board, colour):
+    """ 64-bit key for a position, with colour to move (never 0) """
+    data = (
+        board.tiles.tobytes()
+        + ",".join(board.castle_list).encode()
+        + board.epsq.encode()
+        + colour.encode()
+    )
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    key = int.from_bytes(digest, "little")
+    return key if key != 0 else 1
+
+
+def export_for(board, colour):
+    """ board.export() as an int16 array, definitely with colour to move """
+    position = board.copy()
+    position.current_player = colour # copy() flips it, and think goes by it
+    return np.array(position.export(), dtype=np.int16)
+
+
+def match_moves(board, colour, moves, children, evals):
+    """ Turns cpp think() output (child boards, evals) into {move: eval} """
+    board_map = dict(zip([child.tobytes() for child in children], evals))
+    rows = {
+        move: np.array(child.export(), dtype=np.int16).tobytes()
+        for move, child in board.successors(colour)
+    }
+    return {move: board_map[rows[move]] for move in moves}
+
+
+def get_move_evals(
+    board,
+    colour,
+    moves,
+    think_time,
+    max_nodes,
+    bounded=False,
+    leaf_eval=None
+):
+    """
+    {move: eval} for each of moves, from a cpp think() on the board
+    leaf_eval: see CppBot
+    """
+    import my_module # only needed for making books, not reading them
+    children, evals = my_module.think(
+        export_for(board, colour), think_time, max_nodes, bounded, leaf_eval
+    )
+    return match_moves(board, colour, moves, children, evals.tolist())
+
+
+def get_many_move_evals(jobs, think_time, max_nodes, threads=0):
+    """
+    get_move_evals for a list of (board, colour, moves) all in one go,
+    with the searches spread over threads (0 for one per core)
+    """
+    import my_module
+    if len(jobs) == 0:
+        return []
+    children, evals, offsets = my_module.think_many(
+        np.stack([export_for(board, colour) for board, colour, _ in jobs]),
+        think_time,
+        max_nodes,
+        threads
+    )
+    evals = evals.tolist()
+    return [
+        match_moves(
+            board,
+            colour,
+            moves,
+            children[offsets[i]:offsets[i + 1]],
+            evals[offsets[i]:offsets[i + 1]]
+        )
+        for i, (board, colour, moves) in enumerate(jobs)
+    ]
+
+
+class OpeningBook:
+    """ Read-only book; lookups go straight to the memory map """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = np.memmap(filename, dtype=np.uint8, mode="r")
+        magic, num_slots, num_entries = HEADER.unpack(
+            self.data[:HEADER.size].tobytes()
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not an opening book")
+        offset = HEADER.size
+        end = offset + num_slots * SLOT_DTYPE.itemsize
+        self.slots = self.data[offset:end].view(SLOT_DTYPE)
+        offset, end = end, end + num_entries * ENTRY_DTYPE.itemsize
+        self.entries = self.data[offset:end].view(ENTRY_DTYPE)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.slots["key"]))
+
+    def lookup(self, board, colour):
+        """ {move: eval} for the position, or None if it's not in the book """
+        key = position_hash(board, colour)
+        slot = key % len(self.slots)
+        while True:
+            slot_key = int(self.slots["key"][slot])
+            if slot_key == 0:
+                return None
+            if slot_key == key:
+                break
+            slot = (slot + 1) % len(self.slots)
+        first = int(self.slots["first"][slot])
+        last = first + int(self.slots["count"][slot])
+        return {
+            decode_flip(board, colour, int(move))[2]: float(score)
+            for move, score in self.entries[first:last].tolist()
+        }
+
+
+def load_book(filename=BOOK_FILENAME):
+    """ The OpeningBook in filename, or None if nobody has built one yet """
+    if filename not in BOOKS:
+        BOOKS[filename] = (
+            OpeningBook(filename) if os.path.exists(filename) else None
+        )
+    return BOOKS[filename]
+
+
+def write_book(filename, positions):
+    """ positions is {key: (colour, {move: eval})}, as from build_book """
+    num_slots = 1
+    while num_slots < 2 * len(positions): # keep it at most half full
+        num_slots *= 2
+    slots = np.zeros(num_slots, dtype=SLOT_DTYPE)
+    entries = []
+    for key, (colour, evals) in positions.items():
+        slot = key % num_slots
+        while slots["key"][slot] != 0:
+            slot = (slot + 1) % num_slots
+        slots[slot] = (key, len(entries), len(evals))
+        entries += [
+            (encode_flip(colour, "F", move), score)
+            for move, score in evals.items()
+        ]
+    entries = np.array(entries, dtype=ENTRY_DTYPE)
+    # Write then swap in, so nobody maps a half-written book
+    with open(filename + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, num_slots, len(entries)))
+        f.write(slots.tobytes())
+        f.write(entries.tobytes())
+    os.replace(filename + ".tmp", filename)
+    BOOKS.pop(filename, None)
+
+
+def build_book(
+    filename=BOOK_FILENAME,
+    num_positions=200,
+    think_time=10000,
+    max_nodes=4000000,
+    max_ply=8,
+    threads=None
+):
+    """
+    Deep searches on the most likely early positions, written out as a book
+    Likelihood is play prob under the flip rule, going by the searches
+    themselves: best move gets 1/2, next best 1/4, ...
+    (so it's the positions the bots are actually going to run into)
+    Searches a batch of the likeliest at a time, one per thread
+    """
+    if threads is None:
+        threads = os.cpu_count()
+    counter = 0 # tiebreak, so the heap never has to compare boards
+    heap = [(-1.0, counter, 0, Board(None, None), "W")]
+    positions = {}
+    while len(heap) > 0 and len(positions) < num_positions:
+        # 1. Take the likeliest positions that still need searching
+        batch, jobs = [], []
+        batch_size = min(threads, num_positions - len(positions))
+        while len(heap) > 0 and len(batch) < batch_size:
+            neg_prob, _, ply, board, colour = heapq.heappop(heap)
+            key = position_hash(board, colour)
+            moves = board.get_all_possible_moves(colour)
+            if key in positions or len(moves) == 0:
+                continue
+            if key in [batch_key for batch_key, *_ in batch]:
+                continue
+            batch.append((key, neg_prob, ply))
+            jobs.append((board, colour, moves))
+        # 2. Search them all at once
+        all_evals = get_many_move_evals(jobs, think_time, max_nodes, threads)
+        # 3. Their children go on the heap
+        for (key, neg_prob, ply), (board, colour, _), evals in zip(
+            batch, jobs, all_evals
+        ):
+            positions[key] = (colour, evals)
+            print(f"{len(positions)}/{num_positions}: ", end="")
+            print(f"ply {ply}, prob {-neg_prob:.4f}")
+            if ply + 1 >= max_ply:
+                continue
+            ranked = sorted(evals, key=evals.get, reverse=colour == "W")
+            children = dict(board.successors(colour))
+            for rank, move in enumerate(ranked):
+                child = children[move]
+                if len(child.outcome) > 0: # i.e., a king got taken
+                    continue
+                counter += 1
+                heapq.heappush(heap, (
+                    neg_prob / 2 ** (rank + 1),
+                    counter,
+                    ply + 1,
+                    child,
+                    other_player[colour]
+                ))
+    write_book(filename, positions)
+    return positions
+
+
+if __name__ == "__main__":
+    # python opening_book.py [num positions] [think time (millis)] [file]
+    num_positions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    think_time = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    filename = sys.argv[3] if len(sys.argv) > 3 else BOOK_FILENAME
+    positions = build_book(
+        filename, num_positions=num_positions, think_time=think_time
+    )
+    print(f"Wrote {len(positions)} positions to {filename}")
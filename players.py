@@ -1,16 +1,54 @@
 import numpy as np
 import time
 import random
+import importlib
 from evals import (
-    generate_complex_eval_dict,
+    COMPLEX_EVAL_DICT,
     get_board_score_with_position,
-    get_board_score_with_mobility
+    get_board_score_with_mobility,
+    get_cached_eval
 )
-import pandas as pd
-import torch
+from opening_book import BOOK_FILENAME, load_book
+
+
+# Which module each player lives in. The ones with heavy imports (torch,
+# the cpp module) have their own, so they only get imported once one of
+# those players is actually wanted
+PLAYER_MODULES = {
+    "BozoBot": "players",
+    "OneLayer": "players",
+    "HumanPlayer": "players",
+    "TargetedTree": "players",
+    "CppBot": "cpp_players",
+    "DeepBot": "deep_players",
+    "AutoDeep": "deep_players",
+    "FlatBot": "deep_players",
+}
+
+
+def get_player_class(name):
+    """ Imports (if need be) and returns the player class called name """
+    if name not in PLAYER_MODULES:
+        raise ValueError(
+            f"Unknown player {name}, choose from {list(PLAYER_MODULES)}"
+        )
+    return getattr(importlib.import_module(PLAYER_MODULES[name]), name)
+
 
+def create_player(name, colour, **config):
+    """
+    Makes a player by name, e.g.,
+        create_player("CppBot", "W", thinking_time=1000, max_tree_size=4000000)
+    config is whatever keyword arguments that player's __init__ takes
+    """
+    return get_player_class(name)(colour, **config)
 
-import my_module
+
+def __getattr__(name):
+    # So "from players import CppBot" still works, it's just imported lazily
+    if name in PLAYER_MODULES and PLAYER_MODULES[name] != "players":
+        return get_player_class(name)
+    raise AttributeError(f"module 'players' has no attribute '{name}'")
 
 
 class Player:
@@ -58,126 +96,6 @@ class BozoBot(Player):
         return random.choice(self.possible_moves)
 
 
-class CppBot(Player):
-    # Uses the cpp tree search algo
-    def __init__(self, colour, thinking_time, max_tree_size):
-        super().__init__(colour)
-        self.poss_moves = []
-        self.preferences = None
-        self.thinking_time = thinking_time
-        self.max_tree_size = max_tree_size
-
-    def receive_info(self, board, poss_moves, imp_moves, new_board=True):
-        self.poss_moves = poss_moves
-        if new_board:
-            rs = my_module.think(
-                board.export(),
-                self.thinking_time,
-                self.max_tree_size
-            )
-            board_map = dict(zip([str(r[0]) for r in rs], [r[1] for r in rs]))
-            move_map = {
-                move: str([
-                    int(i) # To make "np.int(3)" appear as "3"
-                    for i in board.copy().process_move(
-                        move, colour=self.colour
-                    ).export()
-                ])
-                for move in self.poss_moves
-            }
-            prefs = {move: board_map[move_map[move]] for move in poss_moves}
-            self.preferences = pd.Series(prefs) / 100
-        self.preferences = self.preferences.loc[poss_moves].sort_values(
-            ascending=self.colour == "B"
-        )
-        print(self.preferences)
-
-    def send_move(self):
-        top_move = self.preferences.index[0]
-        self.preferences = self.preferences.iloc[1:]
-        return top_move
-
-
-class DeepBot(Player):
-    # Template for general neural net play
-    # They differ in their think() methods, so leave that empty
-
-    def __init__(self, colour, model_filepath):
-        super().__init__(colour)
-        self.model = torch.load(model_filepath, weights_only=False)
-        self.model.eval()
-        self.possible_moves = []
-        self.sorted_moves = []
-        self.board = None
-
-    def receive_info(self, board, possible_moves, imp_moves, new_board=True):
-        self.board = board
-        self.possible_moves = possible_moves
-        if new_board:
-            self.think()
-
-    def send_move(self):
-        top_pref = self.sorted_moves[0]
-        self.sorted_moves = self.sorted_moves[1:]
-        return top_pref
-
-    def think(self):
-        return None
-
-
-class AutoDeep(DeepBot):
-    # Uses a pre-trained neural net to do the thinking
-    # Doesn't explore any paths, just evals board which results from each move
-    def think(self):
-        temp_tens = torch.tensor(
-            [
-                self.board.copy().process_move(
-                    move, colour=self.colour
-                ).export()
-                for move in self.possible_moves
-            ],
-            dtype=torch.float32
-        ) # next line is to delete en passant data...
-        board_tensor = torch.cat([temp_tens[:, :68], temp_tens[:, 69:]], dim=1)
-        predictions = self.model(board_tensor).cpu().detach().numpy()[:,0]
-        order = -1 if self.colour == "W" else 1
-        sorted_indices = np.argsort(predictions)[::order]
-        self.sorted_moves = [self.possible_moves[i] for i in sorted_indices]
-
-
-class FlatBot(DeepBot):
-    # Also a pre-trained neural net
-    # But this is one that has a one-hot encoding of board structure
-    # So hopefully plays better
-    def think(self):
-        def get_big_tensor(array):
-            """
-            Transforms each row into a 13x8x8 tensor
-            13 correspond to empty, wpawn, ..., wking, bpawn, ..., bking
-            then the 8x8 is the board
-            all these together are returned as a (len_df)x13x8x8 tensor
-            (copypasted from model training notebook)
-            """
-            np_output = np.zeros((len(array), 13, 8, 8), dtype=np.bool_)
-            for piece_val, board_num in zip(
-                [0, 1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6], range(13)
-            ):
-                mask = (array == piece_val)
-                np_output[:, board_num, :, :] = mask.reshape(len(array), 8, 8)
-            return torch.from_numpy(np_output)
-        temp_array = np.array([
-            self.board.copy().process_move(move, colour=self.colour).export()
-            for move in self.possible_moves
-        ])
-        board_tensor = get_big_tensor(temp_array[:, :64]).flatten(-3).float()
-        with torch.no_grad():
-            predictions = self.model(board_tensor).cpu().detach().numpy()[:,0]
-        order = -1 if self.colour == "W" else 1
-        sorted_indices = np.argsort(predictions)[::order]
-        self.sorted_moves = [self.possible_moves[i] for i in sorted_indices]
-
-
-
 class OneLayer(Player):
     # Structure is basically a copypaste of AutoDeep
     # But instead of a neural net, it just adds up material on the board
@@ -201,17 +119,10 @@ class OneLayer(Player):
         return top_pref
 
     def think(self):
-        points_dict = {
-            "KW": 30, "QW": 9, "RW": 5, "BW": 3, "NW": 3, "PW": 1,
-            "KB": -30, "QB": -9, "RB": -5, "BB": -3, "NB": -3, "PB": -1,
-            "": 0
-        }
+        # Board keeps material totals (30/9/5/3/3/1) up to date already
+        children = dict(self.board.successors(self.colour))
         predictions = np.array([
-            np.vectorize(
-                points_dict.__getitem__
-            )(
-                self.board.copy().process_move(move, colour=self.colour).tiles
-            ).sum().sum()
+            children[move].material["W"] - children[move].material["B"]
             for move in self.possible_moves
         ])
         order = -1 if self.colour == "W" else 1
@@ -239,29 +150,49 @@ class HumanPlayer(Player):
 
 class TargetedTree(Player):
 
-    def __init__(self, colour, think_time, search_const, eval_func, succ_prob):
+    def __init__(
+        self,
+        colour,
+        think_time,
+        search_const,
+        eval_func,
+        succ_prob,
+        book=BOOK_FILENAME
+    ):
         super().__init__(colour)
         self.think_time = think_time
         self.search_const = search_const # best move has this prob of play
         self.play_const = succ_prob
         self.eval_func = eval_func
+        # Same dict every think, so cached evals carry over between moves
+        self.eval_dict = COMPLEX_EVAL_DICT
         self.poss_moves = None
         self.thinking_tree_root = None
         self.board = None
+        self.book = load_book(book) if book is not None else None
+        self.book_evals = None # {move: eval} if the position was in the book
 
     def receive_info(self, board, poss_moves, imp_moves, new_board=True):
         if self.board is not None:
             if not np.all(board.tiles == self.board.tiles): # i.e., new board
                 self.thinking_tree_root = None
+                self.book_evals = None
         self.board = board.copy()
         self.poss_moves = poss_moves
 
     def send_move(self):
-        if self.thinking_tree_root is None:
-            self.think()
+        if self.thinking_tree_root is None and self.book_evals is None:
+            if self.book is not None:
+                self.book_evals = self.book.lookup(self.board, self.colour)
+            if self.book_evals is None:
+                self.think()
+        if self.book_evals is not None:
+            get_eval = lambda x: self.book_evals[x] / 100 # cpp is centipawns
+        else:
+            get_eval = lambda x: self.thinking_tree_root.children[x].eval
         prioritised_moves = sorted(
             self.poss_moves,
-            key=lambda x: self.thinking_tree_root.children[x].eval,
+            key=get_eval,
             reverse=self.colour == "W" # want high evals if white
         )
         return prioritised_moves[0]
@@ -273,7 +204,7 @@ class TargetedTree(Player):
             self.colour,
             self.search_const,
             self.play_const,
-            generate_complex_eval_dict(),
+            self.eval_dict,
             self.eval_func
         )
         self.thinking_tree_root.search_prob = 1
@@ -307,7 +238,7 @@ class ThinkingNode:
         self.play_prob = None
         self.eval_dict = eval_dict
         self.eval_func = eval_func
-        self.eval = eval_func(self.board, self.eval_dict)
+        self.eval = get_cached_eval(self.board, eval_func, self.eval_dict)
         # self.eval = get_board_score_material_only(self.board)
 
     def print_self_and_all_below(self, inherited):
@@ -370,10 +301,7 @@ class ThinkingNode:
             child.update_probs()
 
     def create_children(self):
-        poss_moves = self.board.get_all_possible_moves(self.colour)
-        for move in poss_moves:
-            new_board = self.board.copy()
-            new_board.process_move(move, colour=self.colour)
+        for move, new_board in self.board.successors(self.colour):
             self.children[move] = ThinkingNode(
                 self,
                 new_board,
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+
+CACHES = [] # every PositionCache made, so reset_caches can get at them
+
+
+def reset_caches(maxsize=None):
+    """
+    Empties every PositionCache in this process (and resizes them, if
+    given maxsize); e.g., at the start of a game, or in a worker process
+    that has no use for positions its parent saw
+    """
+    for cache in CACHES:
+        cache.clear()
+        if maxsize is not None:
+            cache.resize(maxsize)
+
+
+class PositionCache:
+    """
+    Least-recently-used cache, keyed on Board.position_key() (plus whatever
+    else the result depends on, e.g., colour or eval function)
+    Keeps hit/miss counts so you can see if it's worth its memory
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        CACHES.append(self)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ Returns cached value, or None if it's not in there """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False) # i.e., least recently used
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0,
+        }
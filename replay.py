@@ -0,0 +1,75 @@
+import csv
+from board import Board
+
+
+CHECKPOINT_INTERVAL = 16 # keep a full Board every this many plies
+
+
+def read_tape(filename):
+    """ Reads a tape csv into list of tuples: (colour, succeed/fail, move) """
+    with open(filename, newline="") as f:
+        reader = csv.reader(f)
+        next(reader) # header: colour, success, move
+        return [tuple(row) for row in reader if len(row) == 3]
+
+
+class TapeReplay:
+    """
+    Positions of a game, built lazily from a tape
+    Only every CHECKPOINT_INTERVAL-th position is stored as a Board,
+    anything in between is replayed from the nearest checkpoint below it
+    NOTE: ply n means the position after n successful moves
+    """
+
+    def __init__(self, tape, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.tape = tape
+        self.interval = checkpoint_interval
+        # moves[n] is (colour, move) taking ply n to ply n + 1
+        self.moves = [(row[0], row[2]) for row in tape if row[1] == "S"]
+        # offsets[n] is how many tape rows have been played by ply n
+        self.offsets = [0]
+        for index, row in enumerate(tape):
+            if row[1] == "S":
+                self.offsets.append(index + 1)
+        self.checkpoints = {0: Board(None, None)}
+        self.last = (0, self.checkpoints[0]) # most recently built position
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        return cls(read_tape(filename), **kwargs)
+
+    def __len__(self):
+        """ Number of positions, i.e., plies including the starting one """
+        return len(self.moves) + 1
+
+    def tape_up_to(self, ply, last=None):
+        """ Tape rows that have been played by given ply (or the last few) """
+        end = self.offsets[ply]
+        start = 0 if last is None else max(0, end - last)
+        return self.tape[start:end]
+
+    def position(self, ply):
+        """
+        Returns Board at given ply; don't modify it, it may be a checkpoint
+        Stepping forward one ply at a time only plays the one new move
+        """
+        last_ply, last_board = self.last
+        if last_ply <= ply and ply - last_ply <= ply % self.interval:
+            start, board = last_ply, last_board
+        else:
+            start = ply - ply % self.interval
+            while start not in self.checkpoints: # i.e., not built yet
+                start -= self.interval
+            board = self.checkpoints[start]
+        for n in range(start, ply):
+            board = self.play_move(board, n)
+            if (n + 1) % self.interval == 0:
+                self.checkpoints[n + 1] = board
+        self.last = (ply, board)
+        return board
+
+    def play_move(self, board, ply):
+        colour, move = self.moves[ply]
+        new_board = board.copy()
+        new_board.process_move(move, colour=colour)
+        return new_board
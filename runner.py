@@ -1,19 +1,31 @@
 import pandas as pd
 import numpy as np
 import random
-import torch
 
 from board import Board
-from players import BozoBot, AutoDeep, OneLayer, FlatBot
+from players import create_player
+from position_cache import reset_caches
 
 
 SUCCESS_PROB = 0.5
 
 
-def do_move(board, tape):
+def get_flip_rngs(seed):
+    """
+    {colour: random generator} for the flips, fixed by seed
+    Each colour has its own stream, so the nth flip white tries always
+    gets the same coin whatever black has been up to (and vice versa)
+    """
+    return {
+        colour: np.random.default_rng([seed, index])
+        for index, colour in enumerate("WB")
+    }
+
+def do_move(board, tape, flip_rngs=None):
     """
     Returns (board, tape, game_outcome)
     game_outcome is +50 if white wins, -50 if black wins, 0 if game ongoing
+    flip_rngs is from get_flip_rngs, or None to just use np.random
     """
     current_player = board.players[board.current_player]
     poss_moves = board.get_all_possible_moves(board.current_player)
@@ -30,7 +42,8 @@ def do_move(board, tape):
             new_board=new_board
         )
         proposed_move = board.get_move_from_player(current_player)
-        move_fails = np.random.uniform(0, 1) > SUCCESS_PROB
+        rng = flip_rngs[board.current_player] if flip_rngs else np.random
+        move_fails = rng.uniform(0, 1) > SUCCESS_PROB
         if move_fails:
             new_board = False
             tape.append((board.current_player, "F", proposed_move))
@@ -40,22 +53,31 @@ def do_move(board, tape):
         tape.append((board.current_player, "S", proposed_move))
         break
     board.process_move(proposed_move)
-    if f"K{board.current_player}" not in board.tiles.flatten():
+    if board.kings[board.current_player] is None:
         game_outcome = -50 if board.current_player == "W" else 50
         return board, tape, game_outcome
     return board, tape, 0
 
-def run_game(white, black, max_moves=500):
+def run_game(
+    white, black, max_moves=500, archive=None, game_id=None, seed=None
+):
     """
     Simple: run a game and save all board states into dataframe
     Returns that dataframe and a signed bit for the game result
+    If given a TapeArchive, the game's tape also gets appended to it
+    If given a seed, the flips' luck is fixed by it (see get_flip_rngs)
     """
+    if archive is not None and game_id is not None and game_id in archive:
+        # Check now, rather than after playing the whole game
+        raise ValueError(f"Already a game {game_id} in {archive.filename}")
+    reset_caches() # last game's positions won't come up again
     board = Board(white, black)
     tape = []
     game_outcome = 0
     game_states = []
+    flip_rngs = None if seed is None else get_flip_rngs(seed)
     while ((game_outcome == 0) and (len(tape) < max_moves // 2)):
-        board, tape, game_outcome = do_move(board, tape)
+        board, tape, game_outcome = do_move(board, tape, flip_rngs)
         game_states.append(board.export())
     columns = (
         [f"sq_{i}" for i in range(64)]
@@ -64,16 +86,25 @@ def run_game(white, black, max_moves=500):
         + ["mover"]
     )
     game_df = pd.DataFrame(game_states, columns=columns)
+    if archive is not None:
+        archive.append(tape, {
+            "white": type(white).__name__,
+            "black": type(black).__name__,
+            "result": game_outcome // 50,
+            "success_prob": SUCCESS_PROB
+        }, game_id=game_id)
     return game_df, game_outcome // 50
 
-def run_whole_process(white, black, id, max_moves=500):
+def run_whole_process(white, black, id, max_moves=500, archive=None):
     """
     Not the WHOLE process, just one iteration of the process
     runs a game, saves board state after each half-move in export format
     adds bonus columns: signed bit for game result
     and one for the game id, so final df has each game be identifiable
     """
-    game_df, game_outcome = run_game(white, black, max_moves=max_moves)
+    game_df, game_outcome = run_game(
+        white, black, max_moves=max_moves, archive=archive, game_id=id
+    )
     game_df["outcome"] = game_outcome
     game_df["game_id"] = id
     return game_df
@@ -82,8 +113,8 @@ def run_whole_process(white, black, id, max_moves=500):
 if __name__ == "__main__":
     iterations = 1000
     name = "5_1k_bigflat3"
-    white = BozoBot("W")
-    black = BozoBot("B")
+    white = create_player("BozoBot", "W")
+    black = create_player("BozoBot", "B")
     processed_dfs = []
     for i in range(iterations):
         processed_df = run_whole_process(white, black, i, max_moves=256)
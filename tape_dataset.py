@@ -0,0 +1,162 @@
+import os
+import sys
+import glob
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from board import Board, other_player
+from replay import read_tape
+from archive import TapeArchive, encode_flip
+from position_cache import reset_caches
+
+
+# Same layout as the runner.py training data, plus where in the game it was
+COLUMNS = (
+    [f"sq_{i}" for i in range(64)]
+    + ["O-Ow", "O-O-Ow", "O-Ob", "O-O-Ob"]
+    + ["epsq"]
+    + ["mover"]
+    + ["outcome", "game_id", "ply", "failed_flips"]
+)
+# Which moves failed, one row per failed flip, alongside the positions:
+# ply is that of the position the move after them led to (one past the
+# game's last position if the mover ran out of moves), and flip is
+# archive.encode_flip of the failed move. failed_flips above is just how
+# many rows here share a game_id and ply
+FAILED_COLUMNS = ["game_id", "ply", "flip"]
+ARCHIVES = {} # filename -> TapeArchive, one per worker process
+
+
+def replay_game(tape, game_id):
+    """
+    Plays through a tape, checking every flip was a legal move
+    Returns (array of positions in COLUMNS layout, array of failed flips
+    in FAILED_COLUMNS layout, error message or None)
+    Each position is the board after a successful move (as in runner.py),
+    with the flips that failed before that move succeeded in the other one
+    """
+    board = Board(None, None)
+    colour = "W"
+    poss_moves = board.get_all_possible_moves(colour)
+    rows = []
+    failed = [] # every failed flip so far
+    num_failed = 0 # how many since the last successful move
+    outcome = 0
+    for index, (row_colour, success, move) in enumerate(tape):
+        if outcome != 0:
+            return None, None, f"flip {index} comes after the game ended"
+        if row_colour != colour:
+            return None, None, f"flip {index} is by {row_colour}, not {colour}"
+        if move not in poss_moves:
+            return None, None, (
+                f"flip {index} ({move}) is not a possible move"
+            )
+        if success == "F":
+            poss_moves.remove(move)
+            failed.append(
+                [game_id, len(rows) + 1, encode_flip(colour, success, move)]
+            )
+            num_failed += 1
+            if len(poss_moves) == 0: # i.e., out of moves, so loses
+                outcome = 1 if colour == "B" else -1
+            continue
+        board.process_move(move, colour=colour)
+        rows.append(board.export() + [0, game_id, len(rows) + 1, num_failed])
+        colour = other_player[colour]
+        if board.kings[colour] is None:
+            outcome = 1 if colour == "B" else -1
+        poss_moves = board.get_all_possible_moves(colour)
+        num_failed = 0
+    positions = np.array(rows, dtype=np.int32).reshape(-1, len(COLUMNS))
+    positions[:, COLUMNS.index("outcome")] = outcome
+    failed = np.array(failed, dtype=np.int32).reshape(-1, len(FAILED_COLUMNS))
+    return positions, failed, None
+
+
+def load_job(job):
+    """ job is (game_id, csv filename) or (game_id, (archive, archive id)) """
+    game_id, source = job
+    if isinstance(source, str):
+        return read_tape(source)
+    filename, archive_id = source
+    if filename not in ARCHIVES:
+        ARCHIVES[filename] = TapeArchive(filename)
+    return ARCHIVES[filename].read(archive_id)[0]
+
+
+def run_job(job):
+    return job, replay_game(load_job(job), job[0])
+
+
+def get_jobs(source):
+    """ Every game in a directory of csv tapes, or in a TapeArchive """
+    if os.path.isdir(source):
+        filenames = sorted(glob.glob(os.path.join(source, "*.csv")))
+        return list(enumerate(filenames))
+    return [
+        (game_id, (source, game_id)) for game_id in TapeArchive(source)
+    ]
+
+
+def init_worker():
+    # A replay only looks at each position once, so caching move lists and
+    # evals is just memory, in every worker
+    reset_caches(maxsize=0)
+
+
+def build_dataset(source, workers=None, chunksize=16):
+    """
+    Replays every game in source across worker processes
+    Returns (array of positions in COLUMNS layout, array of failed flips in
+    FAILED_COLUMNS layout, {game_id: error})
+    """
+    jobs = get_jobs(source)
+    results, failed, errors = [], [], {}
+    with Pool(workers, initializer=init_worker) as pool:
+        for job, result in pool.imap(run_job, jobs, chunksize):
+            positions, game_failed, error = result
+            if error is not None:
+                errors[job[0]] = error
+            else:
+                results.append(positions)
+                failed.append(game_failed)
+    if len(results) == 0:
+        return (
+            np.zeros((0, len(COLUMNS)), dtype=np.int32),
+            np.zeros((0, len(FAILED_COLUMNS)), dtype=np.int32),
+            errors
+        )
+    return np.concatenate(results), np.concatenate(failed), errors
+
+
+def save_dataset(positions, filename, failed=None):
+    """
+    .npz keeps it as arrays, anything else goes to csv like runner
+    failed flips (if given) go in the same .npz, or next to the csv as
+    <name>_failed.csv
+    """
+    if filename.endswith(".npz"):
+        arrays = {"positions": positions, "columns": np.array(COLUMNS)}
+        if failed is not None:
+            arrays["failed"] = failed
+            arrays["failed_columns"] = np.array(FAILED_COLUMNS)
+        np.savez_compressed(filename, **arrays)
+    else:
+        pd.DataFrame(positions, columns=COLUMNS).to_csv(filename, index=False)
+        if failed is not None:
+            pd.DataFrame(failed, columns=FAILED_COLUMNS).to_csv(
+                os.path.splitext(filename)[0] + "_failed.csv", index=False
+            )
+
+
+if __name__ == "__main__":
+    # python tape_dataset.py <tape directory or archive> <output> [workers]
+    if len(sys.argv) not in [3, 4]:
+        print("Usage: python tape_dataset.py <tapes> <output> [workers]")
+        sys.exit(1)
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else None
+    positions, failed, errors = build_dataset(sys.argv[1], workers=workers)
+    for game_id, error in errors.items():
+        print(f"Skipped game {game_id}: {error}")
+    save_dataset(positions, sys.argv[2], failed)
+    print(f"Wrote {len(positions)} positions to {sys.argv[2]}")